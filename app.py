@@ -1,11 +1,21 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
+import functools
 import io
+import shutil
+import tempfile
+import time
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
+import cache
 import database as db
+import ingest
+import jobs
+import report
+import sample_data_generator
+import tracing
 from charts import (
     create_market_scoreboard,
     create_mom_comparison,
@@ -15,7 +25,11 @@ from charts import (
     create_trends_chart,
     create_totals_trend,
     create_action_plan_table,
-    format_currency
+    create_action_plan_figure,
+    format_currency,
+    format_percent,
+    PRIORITY_BANDS,
+    TREND_OVERLAYS
 )
 
 st.set_page_config(
@@ -27,64 +41,7 @@ st.set_page_config(
 
 def load_demo_data():
     """Load demo data for showcase purposes"""
-    np.random.seed(42)
-    
-    markets = ['North America', 'Europe', 'Asia Pacific', 'Latin America', 'Middle East']
-    ledgers = [
-        'Revenue - Product Sales', 'Revenue - Services',
-        'COGS - Materials', 'COGS - Labor', 'COGS - Overhead',
-        'SG&A - Marketing', 'SG&A - Sales', 'SG&A - Admin',
-        'R&D - Development', 'R&D - Research',
-        'Depreciation', 'Interest Expense', 'Other Income', 'Tax Expense'
-    ]
-    months = ['2024-07', '2024-08', '2024-09', '2024-10', '2024-11', '2024-12']
-    
-    base_values = {
-        'Revenue - Product Sales': 1000000, 'Revenue - Services': 300000,
-        'COGS - Materials': -400000, 'COGS - Labor': -200000, 'COGS - Overhead': -100000,
-        'SG&A - Marketing': -80000, 'SG&A - Sales': -120000, 'SG&A - Admin': -60000,
-        'R&D - Development': -50000, 'R&D - Research': -30000,
-        'Depreciation': -25000, 'Interest Expense': -15000, 'Other Income': 10000, 'Tax Expense': -50000
-    }
-    market_multipliers = {'North America': 1.5, 'Europe': 1.2, 'Asia Pacific': 1.0, 'Latin America': 0.6, 'Middle East': 0.4}
-    
-    db.save_column_mapping('Market', 'Ledger Account', 'Actual', 'Plan', 'Forecast')
-    
-    ledger_mapping = pd.DataFrame([
-        {'ledger': 'Revenue - Product Sales', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'Revenue - Services', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'COGS - Materials', 'bucket': 'COGS', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'COGS - Labor', 'bucket': 'COGS', 'driver': 'Headcount', 'controllable': True},
-        {'ledger': 'COGS - Overhead', 'bucket': 'COGS', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'SG&A - Marketing', 'bucket': 'SG&A', 'driver': 'Discretionary', 'controllable': True},
-        {'ledger': 'SG&A - Sales', 'bucket': 'SG&A', 'driver': 'Headcount', 'controllable': True},
-        {'ledger': 'SG&A - Admin', 'bucket': 'SG&A', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'R&D - Development', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
-        {'ledger': 'R&D - Research', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
-        {'ledger': 'Depreciation', 'bucket': 'Non-Cash', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'Interest Expense', 'bucket': 'Financing', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'Other Income', 'bucket': 'Other', 'driver': 'Variable', 'controllable': False},
-        {'ledger': 'Tax Expense', 'bucket': 'Tax', 'driver': 'Calculated', 'controllable': False}
-    ])
-    db.save_ledger_mapping(ledger_mapping)
-    
-    mapping = {'market_col': 'Market', 'ledger_col': 'Ledger Account', 'actual_col': 'Actual', 'plan_col': 'Plan', 'forecast_col': 'Forecast'}
-    
-    for i, month in enumerate(months):
-        data = []
-        growth_factor = 1 + (i * 0.02)
-        for market in markets:
-            for ledger in ledgers:
-                base = base_values[ledger] * market_multipliers[market] * growth_factor
-                data.append({
-                    'Market': market,
-                    'Ledger Account': ledger,
-                    'Actual': round(base * (1 + np.random.uniform(-0.1, 0.15)), 2),
-                    'Plan': round(base * (1 + np.random.uniform(-0.05, 0.05)), 2),
-                    'Forecast': round(base * (1 + np.random.uniform(-0.08, 0.08)), 2)
-                })
-        df = pd.DataFrame(data)
-        db.save_financial_snapshot(df, month, mapping)
+    sample_data_generator.load_into_database(sample_data_generator.generate_frame())
 
 st.markdown("""
 <style>
@@ -129,26 +86,233 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-db.init_database()
-
-if 'demo_loaded' not in st.session_state:
-    st.session_state.demo_loaded = False
+@st.cache_resource(show_spinner=False)
+def initialize_database() -> bool:
+    """Create the schema and seed demo data once per server process rather than on every rerun."""
+    db.init_database()
+    if not db.get_available_months():
+        try:
+            load_demo_data()
+        except Exception:
+            pass
+    return True
 
-if not st.session_state.demo_loaded and not db.get_available_months():
-    try:
-        load_demo_data()
-        st.session_state.demo_loaded = True
-    except Exception:
-        st.session_state.demo_loaded = True
+initialize_database()
 
-def export_chart_to_png(fig, filename):
+@tracing.traced("export")
+def export_chart_to_png(fig, filename=None):
     img_bytes = fig.to_image(format="png", width=1200, height=600, scale=2)
     return img_bytes
 
-def export_chart_to_pdf(fig, filename):
+@tracing.traced("export")
+def export_chart_to_pdf(fig, filename=None):
     pdf_bytes = fig.to_image(format="pdf", width=1200, height=600)
     return pdf_bytes
 
+EXPORT_RENDERERS = {"png": export_chart_to_png, "pdf": export_chart_to_pdf}
+EXPORT_MIME = {"png": "image/png", "pdf": "application/pdf"}
+JOB_POLL_SECONDS = 1.0
+
+def _bucket_scope(args):
+    return ["ledger_mapping"] if args.get("by") == "bucket" else []
+
+get_available_months = cache.cached("snapshots")(db.get_available_months)
+get_markets = cache.cached("snapshots")(db.get_markets)
+get_column_mapping = cache.cached("column_mapping")(db.get_column_mapping)
+get_ledger_mapping = cache.cached("ledger_mapping")(db.get_ledger_mapping)
+month_summary = cache.cached("month:{month_tag}", _bucket_scope)(db.month_summary)
+mom_delta = cache.cached("month:{current_month}", "month:{previous_month}")(db.mom_delta)
+get_snapshot_revisions = cache.cached("snapshots")(db.get_snapshot_revisions)
+trend_metrics = cache.cached("snapshots", _bucket_scope)(db.trend_metrics)
+
+@cache.cached("month:{month_tag}", persist=True)
+def scoreboard_figure(month_tag: str, as_of: str = None):
+    return create_market_scoreboard(month_summary(month_tag, by='market', as_of=as_of), month_tag)
+
+@cache.cached("month:{month_tag}", "ledger_mapping", persist=True)
+def variance_figure(month_tag: str, as_of: str = None):
+    return create_variance_analysis(month_summary(month_tag, by='bucket', as_of=as_of), month_tag, by='bucket')
+
+@cache.cached("month:{current_month}", "month:{previous_month}", persist=True)
+def mom_figure(current_month: str, previous_month: str, market: str = None, as_of: str = None):
+    ledger_delta = mom_delta(current_month, previous_month, market, by='ledger', as_of=as_of)
+    return create_mom_comparison(ledger_delta, current_month, previous_month, market)
+
+@cache.cached("month:{current_month}", "month:{previous_month}", persist=True)
+def movers_figure(current_month: str, previous_month: str, top_n: int, as_of: str = None):
+    movers = db.top_movers(current_month, previous_month, top_n, as_of=as_of)
+    return create_top_movers(movers, current_month, previous_month, top_n)
+
+@cache.cached("month:{month_tag}", persist=True)
+def pareto_figure(month_tag: str, metric_key: str, as_of: str = None):
+    basis = 'plan' if metric_key == 'variance_plan' else 'forecast'
+    return create_pareto_chart(db.variance_pareto(month_tag, basis, top_n=20, as_of=as_of), month_tag, metric_key)
+
+@cache.cached("snapshots", persist=True)
+def totals_figure(overlays: tuple = ()):
+    metrics = trend_metrics('total', 'actual') if overlays else None
+    return create_totals_trend(db.totals_by_month(), metrics, overlays)
+
+def _trend_grouping(trend_data: pd.DataFrame) -> str:
+    return 'bucket' if 'bucket' in trend_data.columns else 'ledger'
+
+@cache.cached("snapshots", "ledger_mapping", persist=True)
+def trends_figure(market: str, metric: str, overlays: tuple = ()):
+    trend_data = db.metric_trend(market, metric)
+    metrics = None
+    if overlays and not trend_data.empty:
+        by = _trend_grouping(trend_data)
+        metrics = trend_metrics(by, metric, market, tuple(trend_data[by].unique()))
+    return create_trends_chart(trend_data, market, metric, metrics, overlays)
+
+@cache.cached("month:{month_tag}")
+def action_plan(month_tag: str, threshold: float, basis: str = 'plan', bands: tuple = PRIORITY_BANDS, top_n: int = 20,
+                as_of: str = None):
+    exceptions = db.variance_exceptions(month_tag, threshold, limit=top_n, basis=basis, as_of=as_of)
+    return create_action_plan_table(exceptions, basis=basis, bands=bands, top_n=top_n)
+
+def pack_renderers() -> dict:
+    """Month-end pack pages through the persisted figure exports, so unchanged pages come straight from disk."""
+    figures = {
+        "scoreboard": scoreboard_figure,
+        "variance": variance_figure,
+        "mom": mom_figure,
+        "movers": movers_figure,
+        "pareto": pareto_figure,
+        "totals": totals_figure,
+        "trends": trends_figure
+    }
+    renderers = {name: functools.partial(figure.export, "pack.pdf", report.render_pdf) for name, figure in figures.items()}
+    renderers["action_plan"] = lambda month_tag, threshold, basis: report.render_pdf(
+        create_action_plan_figure(action_plan(month_tag, threshold, basis), month_tag, basis))
+    return renderers
+
+def export_figure(figure, fmt: str, *args, progress):
+    progress(0.1, f"Rendering {fmt.upper()}")
+    return figure.export(fmt, EXPORT_RENDERERS[fmt], *args)
+
+def save_snapshot_job(path: Path, month_tag: str, mapping: dict, progress):
+    """Load one upload.
+
+    Workbooks are parsed on the process pool into chunk files, which are
+    then staged one chunk at a time, so neither process holds the whole
+    sheet in memory.
+    """
+    chunk_dir = None
+    try:
+        if ingest.is_native_format(path):
+            progress(0.2, "Loading with DuckDB")
+            return db.ingest_file(path, month_tag, mapping, publish_guard=jobs.committing)
+        fingerprint = db.file_fingerprint(path, mapping)
+        skipped = db.unchanged_upload_report(month_tag, fingerprint)
+        if skipped:
+            return skipped
+        total = ingest.excel_row_count(path) or 0
+        chunk_dir = Path(tempfile.mkdtemp(prefix="fa-upload-"))
+        
+        def report_parsed():
+            parsed = min(len(list(chunk_dir.glob(ingest.CHUNK_FILE_PATTERN))) * ingest.DEFAULT_CHUNK_SIZE, total)
+            progress(0.5 * parsed / total if total else 0.0, f"Parsed {parsed:,} of {total:,} rows")
+        
+        progress(0.0, "Parsing workbook")
+        rows = jobs.run_in_process(ingest.spill_excel_chunks, str(path), mapping, str(chunk_dir), on_wait=report_parsed)
+        return db.save_financial_snapshot_chunks(
+            ingest.iter_chunk_files(chunk_dir), month_tag, mapping,
+            progress=lambda staged: progress(0.5 + 0.45 * staged / max(rows, 1), f"Staged {staged:,} of {rows:,} rows"),
+            fingerprint=fingerprint,
+            publish_guard=jobs.committing
+        )
+    finally:
+        path.unlink(missing_ok=True)
+        if chunk_dir is not None:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+
+def archive_job(months: list, progress):
+    """Archive one month at a time.
+
+    A cancel stops before the next month; the months already moved are
+    still reported, with ``cancelled=True``.
+    """
+    months = sorted(set(months))
+    started = time.perf_counter()
+    archived, rows_archived = [], 0
+    for done, month_tag in enumerate(months):
+        try:
+            progress(done / len(months), f"Archived {done} of {len(months)} months")
+            rows_archived += db.archive_months([month_tag], publish_guard=jobs.committing)["rows_archived"]
+        except jobs.JobCancelled:
+            if not archived:
+                raise
+            break
+        archived.append(month_tag)
+    return {
+        "months": archived,
+        "rows_archived": rows_archived,
+        "cancelled": len(archived) < len(months),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+def start_job(key: str, label: str, func, *args, **kwargs) -> jobs.Job:
+    job = jobs.submit(label, func, *args, **kwargs)
+    st.session_state.setdefault("jobs", {})[key] = job.id
+    return job
+
+def job_running(key: str) -> bool:
+    job = jobs.get(st.session_state.get("jobs", {}).get(key))
+    return job is not None and not job.done
+
+def render_job(key: str, on_done):
+    """Show the job started under ``key``: live progress and Cancel while it runs, then ``on_done(job)``."""
+    job = jobs.get(st.session_state.get("jobs", {}).get(key))
+    if job is None:
+        return
+    st.fragment(render_job_status, run_every=None if job.done else JOB_POLL_SECONDS)(key, job.id, not job.done, on_done)
+
+def render_job_status(key: str, job_id: int, polling: bool, on_done):
+    job = jobs.get(job_id)
+    if job is None:
+        return
+    if not job.done:
+        st.progress(job.progress, text=f"{job.label}: {job.message or job.status} ({job.elapsed:.0f}s)")
+        if st.button("✖️ Cancel", key=f"cancel_{key}", disabled=job.cancel_requested or job.committing):
+            job.cancel()
+    elif polling:
+        st.rerun()
+    elif job.status == "failed":
+        st.error(f"{job.label} failed: {job.error_message}")
+    elif job.status == "cancelled":
+        st.info(f"{job.label} cancelled.")
+    else:
+        on_done(job)
+
+def render_as_of_picker(*months: str):
+    """'As of' selector over the uploads that restated ``months``; returns None for the latest data."""
+    revisions = get_snapshot_revisions(tuple(dict.fromkeys(months)))
+    if not revisions['month_tag'].duplicated().any():
+        return None
+    # The newest upload is what "Latest" shows already.
+    earlier = {row.uploaded_at.isoformat(): row for row in revisions.iloc[1:].itertuples()}
+    as_of = st.selectbox(
+        "As of", [None] + list(earlier),
+        format_func=lambda stamp: "Latest" if stamp is None else (
+            f"{earlier[stamp].uploaded_at:%Y-%m-%d %H:%M} — {earlier[stamp].month_tag} upload #{earlier[stamp].revision} "
+            f"(+{earlier[stamp].inserted:,} ~{earlier[stamp].updated:,} -{earlier[stamp].deleted:,})"
+        ),
+        help="Show the data as it stood right after an earlier upload"
+    )
+    if as_of:
+        st.caption(f"Showing data as of {earlier[as_of].uploaded_at:%Y-%m-%d %H:%M:%S}; later restatements are ignored.")
+    return as_of
+
+def render_export_buttons(figure, args: tuple, filename: str, label: str = "", formats: tuple = ("png", "pdf")):
+    for column, fmt in zip(st.columns(2), formats):
+        key = f"export:{filename}.{fmt}:{args}"
+        with column:
+            if st.button(f"📥 Export {label}as {fmt.upper()}", key=f"start_{key}", disabled=job_running(key)):
+                start_job(key, f"{filename}.{fmt}", export_figure, figure, fmt, *args)
+            render_job(key, lambda job, fmt=fmt, key=key: st.download_button(
+                f"Download {fmt.upper()}", job.result, f"{filename}.{fmt}", EXPORT_MIME[fmt], key=f"download_{key}"))
+
 def main():
     st.markdown('<p class="main-header">📊 Financial Analytics Tool</p>', unsafe_allow_html=True)
     st.markdown('<p class="sub-header">Local-only month-over-month financial analysis • Powered by DuckDB</p>', unsafe_allow_html=True)
@@ -164,27 +328,52 @@ def main():
         
         st.markdown("---")
         st.markdown("### Data Status")
-        months = db.get_available_months()
+        months = get_available_months()
         if months:
             st.success(f"✅ {len(months)} months loaded")
             st.caption(f"Latest: {months[0]}")
         else:
             st.warning("⚠️ No data uploaded yet")
     
-    if "🏠" in page:
-        render_home_page()
-    elif "⚙️" in page:
-        render_settings_page()
-    elif "📈" in page:
-        render_scoreboard_page()
-    elif "📊 MoM" in page:
-        render_mom_page()
-    elif "🎯" in page:
-        render_pareto_page()
-    elif "📉" in page:
-        render_trends_page()
-    elif "📋" in page:
-        render_action_plan_page()
+    with tracing.span(page, "page"):
+        if "🏠" in page:
+            render_home_page()
+        elif "⚙️" in page:
+            render_settings_page()
+        elif "📈" in page:
+            render_scoreboard_page()
+        elif "📊 MoM" in page:
+            render_mom_page()
+        elif "🎯" in page:
+            render_pareto_page()
+        elif "📉" in page:
+            render_trends_page()
+        elif "📋" in page:
+            render_action_plan_page()
+
+def render_performance_panel(trace: tracing.Trace):
+    history = st.session_state.setdefault("rerun_history", [])
+    history.append(round(trace.duration_ms, 1))
+    del history[:-20]
+    
+    with st.sidebar.expander("⏱️ Performance"):
+        st.metric("This rerun", f"{trace.duration_ms:,.0f} ms")
+        if len(history) > 1:
+            st.caption("Recent reruns (ms): " + ", ".join(f"{ms:,.0f}" for ms in history[-10:]))
+        summary = trace.summary()
+        if summary.empty:
+            st.caption("No instrumented calls this rerun.")
+        else:
+            st.dataframe(
+                summary.round({'total_ms': 1, 'max_ms': 1}),
+                hide_index=True,
+                use_container_width=True
+            )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("JSON", trace.to_json(), "trace.json", "application/json")
+        with col2:
+            st.download_button("Chrome trace", trace.to_chrome_trace(), "trace.chrome.json", "application/json")
 
 def render_home_page():
     st.header("Upload Financial Report")
@@ -193,50 +382,24 @@ def render_home_page():
     
     with col1:
         uploaded_file = st.file_uploader(
-            "Upload Excel file (.xlsx)",
-            type=['xlsx'],
+            "Upload report (.xlsx, .csv, .parquet)",
+            type=[suffix.lstrip('.') for suffix in ingest.SUPPORTED_SUFFIXES],
             help="Upload your monthly financial report"
         )
         
-        if uploaded_file:
-            try:
-                df = pd.read_excel(uploaded_file)
-                st.success(f"✅ Loaded {len(df)} rows, {len(df.columns)} columns")
-                
-                with st.expander("Preview Data", expanded=True):
-                    st.dataframe(df.head(10), use_container_width=True)
-                
-                mapping = db.get_column_mapping()
-                
-                if mapping:
-                    st.info("Using saved column mapping. Go to Settings to change.")
-                    
-                    month_tag = st.text_input(
-                        "Month Tag (YYYY-MM)",
-                        value=datetime.now().strftime("%Y-%m"),
-                        help="Enter the month this report represents"
-                    )
-                    
-                    if st.button("💾 Save Snapshot", type="primary"):
-                        try:
-                            db.save_financial_snapshot(df, month_tag, mapping)
-                            st.success(f"✅ Snapshot saved for {month_tag}")
-                            st.balloons()
-                        except Exception as e:
-                            st.error(f"Error saving: {e}")
-                else:
-                    st.warning("⚠️ Please configure column mapping in Settings first")
-                    
-            except Exception as e:
-                st.error(f"Error reading file: {e}")
+        try:
+            upload = inspect_upload(uploaded_file)
+            if upload:
+                render_upload_form(uploaded_file.name, upload["path"], upload["preview"], upload["rows"])
+        except Exception as e:
+            st.error(f"Error reading file: {e}")
     
     with col2:
         st.markdown("### Quick Stats")
-        months = db.get_available_months()
+        months = get_available_months()
         
         if months:
-            all_data = db.get_all_snapshots()
-            latest = all_data[all_data['month_tag'] == months[0]]
+            latest = month_summary(months[0], by='market')
             
             total_actual = latest['actual'].sum()
             total_plan = latest['plan'].sum()
@@ -246,28 +409,99 @@ def render_home_page():
             st.metric("Latest Month", months[0])
             st.metric("Net Position", format_currency(total_actual))
             st.metric("vs Plan", f"{var_pct:+.1f}%", delta=format_currency(variance))
-            st.metric("Markets", len(latest['market'].unique()))
+            st.metric("Markets", len(latest))
         else:
             st.info("Upload data to see stats")
 
+def inspect_upload(uploaded_file) -> Optional[dict]:
+    """The spooled file, preview and row count of the current upload, kept in session state per file id.
+
+    Spooling a large upload and opening the workbook twice is too slow to
+    repeat on every rerun. The spooled file is deleted once the upload is
+    replaced or cleared.
+    """
+    file_id = uploaded_file.file_id if uploaded_file else None
+    upload = st.session_state.get("upload")
+    if upload is not None and upload["file_id"] != file_id:
+        upload["path"].unlink(missing_ok=True)
+        del st.session_state["upload"]
+        upload = None
+    if uploaded_file is None or upload is not None:
+        return upload
+    path = ingest.spool_upload(uploaded_file)
+    try:
+        preview, rows = ingest.preview_file(path, n_rows=10), ingest.row_count(path)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    st.session_state["upload"] = {"file_id": file_id, "path": path, "preview": preview, "rows": rows}
+    return st.session_state["upload"]
+
+def render_upload_form(filename: str, upload_path: Path, preview: pd.DataFrame, total_rows: Optional[int]):
+    rows_label = f"{total_rows:,} rows" if total_rows is not None else "file"
+    st.success(f"✅ Loaded {rows_label}, {len(preview.columns)} columns")
+    
+    with st.expander("Preview Data", expanded=True):
+        st.dataframe(preview, use_container_width=True)
+    
+    mapping = get_column_mapping()
+    
+    if not mapping:
+        st.warning("⚠️ Please configure column mapping in Settings first")
+        return
+    
+    st.info("Using saved column mapping. Go to Settings to change.")
+    
+    month_tag = st.text_input(
+        "Month Tag (YYYY-MM)",
+        value=ingest.infer_month_tag(filename) or datetime.now().strftime("%Y-%m"),
+        help="Enter the month this report represents"
+    )
+    
+    valid_tag = bool(db.MONTH_TAG_FORMAT.match(month_tag))
+    if not valid_tag:
+        st.error(f"❌ '{month_tag}' is not a month tag; use YYYY-MM, e.g. 2024-12")
+    
+    key = f"upload:{filename}:{month_tag}"
+    if st.button("💾 Save Snapshot", type="primary", disabled=job_running(key) or not valid_tag):
+        start_job(key, f"Save {month_tag}", save_snapshot_job, ingest.detach_upload(upload_path), month_tag, mapping)
+    
+    def show_saved(job):
+        report = job.result
+        if report['skipped']:
+            st.info(f"ℹ️ Identical to the last upload for {month_tag} — nothing written")
+            return
+        st.success(
+            f"✅ Snapshot saved for {month_tag} — {report['inserted']:,} inserted, {report['updated']:,} updated, "
+            f"{report['deleted']:,} deleted, {report['unchanged']:,} unchanged in {report['seconds']:.2f}s"
+        )
+        if report['duplicates_dropped']:
+            st.warning(f"⚠️ {report['duplicates_dropped']:,} duplicate market/ledger rows were merged (last row kept)")
+        celebrated = st.session_state.setdefault("celebrated_jobs", set())
+        if job.id not in celebrated:
+            celebrated.add(job.id)
+            st.balloons()
+    
+    render_job(key, show_saved)
+
 def render_settings_page():
     st.header("⚙️ Settings & Configuration")
     
-    tab1, tab2 = st.tabs(["Column Mapping", "Ledger Mapping"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Column Mapping", "Ledger Mapping", "Archive", "Slow Queries", "Background Jobs"])
     
     with tab1:
         st.subheader("Column Mapping")
         st.caption("Map your Excel columns to the required fields (one-time setup)")
         
         uploaded_file = st.file_uploader(
-            "Upload a sample Excel to detect columns",
-            type=['xlsx'],
+            "Upload a sample report to detect columns",
+            type=[suffix.lstrip('.') for suffix in ingest.SUPPORTED_SUFFIXES],
             key="mapping_file"
         )
         
         if uploaded_file:
-            df = pd.read_excel(uploaded_file)
-            columns = [''] + list(df.columns)
+            with ingest.spooled_upload(uploaded_file) as sample_path:
+                columns = [''] + list(ingest.preview_file(sample_path, n_rows=1).columns)
             
             col1, col2 = st.columns(2)
             
@@ -285,7 +519,7 @@ def render_settings_page():
                     db.save_column_mapping(market_col, ledger_col, actual_col, plan_col, forecast_col)
                     st.success("✅ Column mapping saved!")
         
-        current_mapping = db.get_column_mapping()
+        current_mapping = get_column_mapping()
         if current_mapping:
             st.markdown("---")
             st.markdown("**Current Mapping:**")
@@ -310,47 +544,151 @@ def render_settings_page():
                 db.save_ledger_mapping(mapping_df)
                 st.success("✅ Ledger mapping saved!")
         
-        current_ledger = db.get_ledger_mapping()
+        current_ledger = get_ledger_mapping()
         if not current_ledger.empty:
             st.markdown("---")
             st.markdown("**Current Ledger Mapping:**")
             st.dataframe(current_ledger, use_container_width=True)
+    
+    with tab3:
+        st.subheader("Archive")
+        st.caption("Move closed months to the Parquet archive. Dashboards keep reading them transparently.")
+        
+        hot_months = db.get_hot_months()
+        archived_months = db.get_archived_months()
+        
+        col1, col2 = st.columns(2)
+        col1.metric("Months in database", len(hot_months))
+        col2.metric("Archived months", len(archived_months))
+        
+        to_archive = st.multiselect("Months to archive", hot_months[1:], help="The latest month always stays in the database")
+        if to_archive and st.button("🗄️ Archive Selected Months", type="primary", disabled=job_running("archive")):
+            start_job("archive", f"Archive {len(to_archive)} months", archive_job, to_archive)
+        render_job("archive", lambda job: (st.warning if job.result["cancelled"] else st.success)(
+            f"{'⚠️ Cancelled after archiving' if job.result['cancelled'] else '✅ Archived'} "
+            f"{len(job.result['months'])} months ({job.result['rows_archived']:,} rows) in {job.result['seconds']:.2f}s"))
+        
+        if archived_months:
+            st.markdown("---")
+            st.markdown("**Archived:** " + ", ".join(archived_months))
+            st.caption("Re-uploading an archived month moves it back into the database.")
+    
+    with tab4:
+        st.subheader("Slow Query Log")
+        st.caption("Queries and writes slower than the threshold are logged to data/slow_queries.jsonl; reads also record their EXPLAIN ANALYZE plan.")
+        
+        settings = db.configure_slow_query_log()
+        col1, col2 = st.columns(2)
+        with col1:
+            enabled = st.toggle("Log slow queries", value=settings["enabled"])
+        with col2:
+            threshold_ms = st.number_input("Threshold (ms)", min_value=0.0, value=float(settings["threshold_ms"]), step=50.0)
+        db.configure_slow_query_log(enabled=enabled, threshold_ms=threshold_ms)
+        
+        slow_queries = db.get_slow_queries()
+        if slow_queries.empty:
+            st.info("No slow queries logged.")
+        else:
+            st.dataframe(
+                slow_queries[['logged_at', 'kind', 'elapsed_ms', 'rows', 'sql']],
+                hide_index=True,
+                use_container_width=True
+            )
+            selected = st.selectbox(
+                "Inspect plan",
+                slow_queries.index,
+                format_func=lambda i: f"{slow_queries.at[i, 'logged_at']} — {slow_queries.at[i, 'elapsed_ms']:,.0f} ms"
+            )
+            entry = slow_queries.loc[selected]
+            st.code(entry['sql'], language="sql")
+            if entry['params']:
+                st.caption(f"Parameters: {entry['params']}")
+            st.code(entry['plan'] or "No plan captured: writes are not re-run under the profiler.", language="text")
+            if st.button("🗑️ Clear Log"):
+                db.clear_slow_queries()
+                st.rerun()
+    
+    with tab5:
+        st.subheader("Background Jobs")
+        st.caption("Uploads, archiving and exports run off the page so other widgets stay responsive.")
+        all_jobs = jobs.list_jobs()
+        running = any(not job.done for job in all_jobs)
+        st.fragment(render_jobs_table, run_every=JOB_POLL_SECONDS if running else None)(running)
+
+def render_jobs_table(polling: bool):
+    all_jobs = jobs.list_jobs()
+    if not all_jobs:
+        st.info("No jobs submitted in this server process yet.")
+        return
+    if polling and all(job.done for job in all_jobs):
+        st.rerun()
+    st.dataframe(
+        pd.DataFrame([{
+            "id": job.id,
+            "job": job.label,
+            "pool": job.kind,
+            "status": job.status,
+            "progress": job.progress,
+            "message": job.error_message or job.message,
+            "seconds": round(job.elapsed, 1)
+        } for job in all_jobs]),
+        hide_index=True,
+        use_container_width=True,
+        column_config={"progress": st.column_config.ProgressColumn(min_value=0.0, max_value=1.0)}
+    )
+    active = {job.id: job for job in all_jobs if not job.done}
+    if active:
+        col1, col2 = st.columns([3, 1])
+        selected = col1.selectbox("Running job", list(active), format_func=lambda job_id: f"#{job_id} {active[job_id].label}")
+        if col2.button("✖️ Cancel Job", disabled=active[selected].cancel_requested or active[selected].committing):
+            active[selected].cancel()
 
 def render_scoreboard_page():
     st.header("📈 Market Scoreboard")
     
-    months = db.get_available_months()
+    months = get_available_months()
     if not months:
         st.warning("No data available. Please upload financial reports first.")
         return
     
     selected_month = st.selectbox("Select Month", months)
+    as_of = render_as_of_picker(selected_month)
     
-    all_data = db.get_all_snapshots()
-    
-    fig = create_market_scoreboard(all_data, selected_month)
+    fig = scoreboard_figure(selected_month, as_of)
     st.plotly_chart(fig, use_container_width=True)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("📥 Export as PNG"):
-            img = export_chart_to_png(fig, "scoreboard")
-            st.download_button("Download PNG", img, "market_scoreboard.png", "image/png")
-    with col2:
-        if st.button("📥 Export as PDF"):
-            pdf = export_chart_to_pdf(fig, "scoreboard")
-            st.download_button("Download PDF", pdf, "market_scoreboard.pdf", "application/pdf")
+    render_export_buttons(scoreboard_figure, (selected_month, as_of), "market_scoreboard")
     
     st.markdown("---")
     st.subheader("Variance Analysis")
     
-    var_fig = create_variance_analysis(all_data, selected_month, by='bucket')
+    var_fig = variance_figure(selected_month, as_of)
     st.plotly_chart(var_fig, use_container_width=True)
+    
+    st.markdown("---")
+    render_month_end_pack(selected_month, months)
+
+def render_month_end_pack(month_tag: str, months: list):
+    st.subheader("📦 Month-End Pack")
+    previous_month = next((m for m in months if m < month_tag), None)
+    st.caption(f"Every chart for {month_tag}" + (f" vs {previous_month}" if previous_month else "")
+               + " plus the action plan, as one PDF. Built in the background so you can keep working.")
+    
+    key = f"pack:{month_tag}"
+    if st.button("📦 Build Month-End Pack", disabled=job_running(key)):
+        start_job(key, f"Month-end pack {month_tag}", report.build_month_end_pack,
+                  month_tag, previous_month, pack_renderers())
+    
+    def show_pack(job):
+        st.download_button("Download Month-End Pack", job.result, f"month_end_pack_{month_tag}.pdf", "application/pdf")
+        st.caption(f"{month_tag} pack built in {job.elapsed:.1f}s")
+    
+    render_job(key, show_pack)
 
 def render_mom_page():
     st.header("📊 Month-over-Month Analysis")
     
-    months = db.get_available_months()
+    months = get_available_months()
     if len(months) < 2:
         st.warning("Need at least 2 months of data for MoM analysis.")
         return
@@ -366,33 +704,28 @@ def render_mom_page():
             st.warning("No previous month available")
             return
     with col3:
-        markets = ['All Markets'] + db.get_markets()
+        markets = ['All Markets'] + get_markets()
         selected_market = st.selectbox("Market Filter", markets)
     
-    all_data = db.get_all_snapshots()
-    
     market_filter = None if selected_market == 'All Markets' else selected_market
+    as_of = render_as_of_picker(current_month, previous_month)
     
-    mom_fig = create_mom_comparison(all_data, current_month, previous_month, market_filter)
+    mom_fig = mom_figure(current_month, previous_month, market_filter, as_of)
     st.plotly_chart(mom_fig, use_container_width=True)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("📥 Export MoM as PNG"):
-            img = export_chart_to_png(mom_fig, "mom")
-            st.download_button("Download PNG", img, "mom_analysis.png", "image/png")
+    render_export_buttons(mom_figure, (current_month, previous_month, market_filter, as_of), "mom_analysis", "MoM ", ("png",))
     
     st.markdown("---")
     st.subheader("Top Movers")
     
     top_n = st.slider("Number of top movers", 5, 20, 10)
-    movers_fig = create_top_movers(all_data, current_month, previous_month, top_n)
+    movers_fig = movers_figure(current_month, previous_month, top_n, as_of)
     st.plotly_chart(movers_fig, use_container_width=True)
 
 def render_pareto_page():
     st.header("🎯 Pareto Analysis")
     
-    months = db.get_available_months()
+    months = get_available_months()
     if not months:
         st.warning("No data available.")
         return
@@ -403,21 +736,13 @@ def render_pareto_page():
     with col2:
         metric = st.radio("Variance Type", ["vs Plan", "vs Forecast"], horizontal=True)
     
-    all_data = db.get_all_snapshots()
     metric_key = 'variance_plan' if metric == "vs Plan" else 'variance_forecast'
+    as_of = render_as_of_picker(selected_month)
     
-    fig = create_pareto_chart(all_data, selected_month, metric_key)
+    fig = pareto_figure(selected_month, metric_key, as_of)
     st.plotly_chart(fig, use_container_width=True)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("📥 Export Pareto as PNG"):
-            img = export_chart_to_png(fig, "pareto")
-            st.download_button("Download PNG", img, "pareto_chart.png", "image/png")
-    with col2:
-        if st.button("📥 Export Pareto as PDF"):
-            pdf = export_chart_to_pdf(fig, "pareto")
-            st.download_button("Download PDF", pdf, "pareto_chart.pdf", "application/pdf")
+    render_export_buttons(pareto_figure, (selected_month, metric_key, as_of), "pareto_chart", "Pareto ")
     
     st.markdown("---")
     st.caption("The Pareto chart shows which items contribute most to total variance. The 80% line helps identify the vital few.")
@@ -425,53 +750,88 @@ def render_pareto_page():
 def render_trends_page():
     st.header("📉 Trend Analysis")
     
-    months = db.get_available_months()
+    months = get_available_months()
     if len(months) < 2:
         st.warning("Need at least 2 months of data for trend analysis.")
         return
     
-    all_data = db.get_all_snapshots()
+    overlay_columns = {label: column for column, (label, _) in TREND_OVERLAYS.items()}
+    overlays = tuple(overlay_columns[label] for label in st.multiselect(
+        "Overlays", list(overlay_columns),
+        help="Moving averages need that many consecutive months; growth is drawn on the totals chart only"
+    ))
     
-    totals_fig = create_totals_trend(all_data)
+    totals_fig = totals_figure(overlays)
     st.plotly_chart(totals_fig, use_container_width=True)
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("📥 Export Trend as PNG"):
-            img = export_chart_to_png(totals_fig, "trend")
-            st.download_button("Download PNG", img, "trend_chart.png", "image/png")
+    render_export_buttons(totals_figure, (overlays,), "trend_chart", "Trend ", ("png",))
     
     st.markdown("---")
     st.subheader("Detailed Trends")
     
     col1, col2 = st.columns(2)
     with col1:
-        markets = ['All Markets'] + db.get_markets()
+        markets = ['All Markets'] + get_markets()
         selected_market = st.selectbox("Market", markets)
     with col2:
         metric = st.selectbox("Metric", ['actual', 'plan', 'forecast'])
     
     market_filter = None if selected_market == 'All Markets' else selected_market
-    detail_fig = create_trends_chart(all_data, market_filter, metric)
+    detail_fig = trends_figure(market_filter, metric, overlays)
     st.plotly_chart(detail_fig, use_container_width=True)
+    
+    st.markdown("---")
+    st.subheader("Growth & Run-Rate")
+    render_growth_table(market_filter, metric)
+
+def render_growth_table(market: str, metric: str):
+    by = st.radio("Group by", ['market', 'bucket', 'ledger'], horizontal=True, format_func=str.title)
+    trend = trend_metrics(by, metric, market)
+    if trend.empty:
+        st.info(f"No {by} data for this selection.")
+        return
+    latest_month = trend['month_tag'].max()
+    latest = trend[trend['month_tag'] == latest_month].sort_values('value', ascending=False).copy()
+    for column in ('value', 'ma_3', 'ytd', 'run_rate'):
+        latest[column] = format_currency(latest[column])
+    for column in ('mom_pct', 'yoy_pct'):
+        latest[column] = format_percent(latest[column])
+    st.caption(f"{metric.title()} for {latest_month}; YTD is calendar year to date and run-rate annualizes it.")
+    st.dataframe(
+        latest[[by, 'value', 'ma_3', 'mom_pct', 'yoy_pct', 'ytd', 'run_rate']].rename(columns={
+            by: by.title(), 'value': metric.title(), 'ma_3': '3-Month Avg', 'mom_pct': 'MoM',
+            'yoy_pct': 'YoY', 'ytd': 'YTD', 'run_rate': 'Run-Rate'
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
 
 def render_action_plan_page():
     st.header("📋 Action Plan")
     
-    months = db.get_available_months()
+    months = get_available_months()
     if not months:
         st.warning("No data available.")
         return
     
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         selected_month = st.selectbox("Select Month", months)
     with col2:
         threshold = st.slider("Variance Threshold (%)", 1, 20, 5)
+    with col3:
+        basis = st.radio("Variance vs", ["Plan", "Forecast"], horizontal=True).lower()
+    as_of = render_as_of_picker(selected_month)
     
-    all_data = db.get_all_snapshots()
+    default_bands = dict((label, threshold_pct) for threshold_pct, label in PRIORITY_BANDS)
+    with st.expander("Priority bands"):
+        band_col1, band_col2 = st.columns(2)
+        high = band_col1.number_input("High above (%)", min_value=0.0, value=default_bands['High'], step=1.0)
+        medium = band_col2.number_input("Medium above (%)", min_value=0.0, value=default_bands['Medium'], step=1.0)
+        if high < medium:
+            st.warning("High threshold is below Medium, so lines between them are labelled High.")
     
-    action_df = create_action_plan_table(all_data, selected_month, threshold)
+    action_df = action_plan(selected_month, threshold, basis, ((high, 'High'), (medium, 'Medium')), as_of=as_of).copy()
     
     if action_df.empty:
         st.success(f"✅ No items exceed {threshold}% variance threshold!")
@@ -490,9 +850,8 @@ def render_action_plan_page():
         
         st.markdown("---")
         
-        action_df['Actual'] = action_df['Actual'].apply(format_currency)
-        action_df['Plan'] = action_df['Plan'].apply(format_currency)
-        action_df['Variance'] = action_df['Variance'].apply(format_currency)
+        for column in ('Actual', basis.title(), 'Variance'):
+            action_df[column] = format_currency(action_df[column])
         
         st.dataframe(
             action_df,
@@ -514,5 +873,7 @@ def render_action_plan_page():
         )
 
 if __name__ == "__main__":
-    main()
+    with tracing.record() as rerun_trace:
+        main()
+    render_performance_panel(rerun_trace)
 
@@ -0,0 +1,134 @@
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import database as db
+import ingest
+
+DEFAULT_PATTERN = "financial_report_*"
+
+def collect_files(inputs: list, pattern: str = DEFAULT_PATTERN) -> list:
+    files = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            files.extend(p for p in sorted(path.glob(pattern)) if p.suffix.lower() in ingest.SUPPORTED_SUFFIXES)
+        elif any(ch in item for ch in "*?["):
+            files.extend(Path(p) for p in sorted(glob.glob(item)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+def _parse_workbook(path: str, mapping: dict, chunk_size: int) -> tuple:
+    started = time.perf_counter()
+    frame = ingest.read_excel_mapped(path, mapping, chunk_size)
+    return frame, time.perf_counter() - started
+
+def _result(path: Path, month_tag: str, report: dict, parse_seconds: float) -> dict:
+    return {
+        "file": path.name,
+        "month_tag": month_tag,
+        "rows": report["rows_read"],
+        "changes": "skipped" if report["skipped"] else f"+{report['inserted']} ~{report['updated']} -{report['deleted']}",
+        "parse_seconds": parse_seconds,
+        "write_seconds": report["seconds"],
+        "error": None
+    }
+
+def run_batch(files: list, mapping: dict, workers: int = None, chunk_size: int = ingest.DEFAULT_CHUNK_SIZE) -> list:
+    jobs = []
+    results = []
+    for path in files:
+        month_tag = ingest.infer_month_tag(path.name)
+        if month_tag is None:
+            results.append({"file": path.name, "month_tag": None, "error": "no YYYY-MM in filename"})
+        else:
+            jobs.append((path, month_tag))
+
+    native_files = [(path, month_tag) for path, month_tag in jobs if ingest.is_native_format(path)]
+    workbooks = []
+    for path, month_tag in jobs:
+        if ingest.is_native_format(path):
+            continue
+        fingerprint = db.file_fingerprint(path, mapping)
+        skipped = db.unchanged_upload_report(month_tag, fingerprint)
+        if skipped:
+            results.append(_result(path, month_tag, skipped, 0.0))
+        else:
+            workbooks.append((path, month_tag, fingerprint))
+
+    # Spawned, not forked: the parent already holds DuckDB handles.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(_parse_workbook, str(path), mapping, chunk_size): (path, month_tag, fingerprint)
+            for path, month_tag, fingerprint in workbooks
+        }
+        for path, month_tag in native_files:
+            try:
+                report = db.ingest_file(path, month_tag, mapping)
+            except Exception as e:
+                results.append({"file": path.name, "month_tag": month_tag, "error": str(e)})
+                continue
+            results.append(_result(path, month_tag, report, 0.0))
+        for future in as_completed(futures):
+            path, month_tag, fingerprint = futures[future]
+            try:
+                frame, parse_seconds = future.result()
+                report = db.save_financial_snapshot(frame, month_tag, mapping, fingerprint=fingerprint)
+            except Exception as e:
+                results.append({"file": path.name, "month_tag": month_tag, "error": str(e)})
+                continue
+            results.append(_result(path, month_tag, report, parse_seconds))
+    return sorted(results, key=lambda r: (r["month_tag"] or "", r["file"]))
+
+def print_summary(results: list, elapsed: float):
+    print(f"{'File':<40} {'Month':<8} {'Rows':>10} {'Changes':>20} {'Parse s':>8} {'Write s':>8} {'Rows/s':>10}")
+    total_rows = 0
+    for r in results:
+        if r["error"]:
+            print(f"{r['file']:<40} {r['month_tag'] or '-':<8} FAILED: {r['error']}")
+            continue
+        seconds = r["parse_seconds"] + r["write_seconds"]
+        rate = r["rows"] / seconds if seconds else 0
+        total_rows += r["rows"]
+        print(f"{r['file']:<40} {r['month_tag']:<8} {r['rows']:>10,} {r['changes']:>20} {r['parse_seconds']:>8.2f} {r['write_seconds']:>8.2f} {rate:>10,.0f}")
+    failed = sum(1 for r in results if r["error"])
+    skipped = sum(1 for r in results if not r["error"] and r["changes"] == "skipped")
+    rate = total_rows / elapsed if elapsed else 0
+    print(f"\n{len(results) - failed - skipped} loaded, {skipped} unchanged, {failed} failed — {total_rows:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load monthly financial reports into the analytics database.")
+    parser.add_argument("inputs", nargs="+", help="Directories, files or glob patterns of .xlsx/.csv/.parquet reports (month is read from the filename)")
+    parser.add_argument("--pattern", default=DEFAULT_PATTERN, help="Filename pattern used inside directories")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parser processes")
+    parser.add_argument("--chunk-size", type=int, default=ingest.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--db", default=str(db.DB_PATH), help="DuckDB file to write to")
+    parser.add_argument("--mode", choices=db.DB_MODES, default=db.DB_MODE,
+                        help="'shared' when app workers read the same file (default: $FA_DB_MODE or single)")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db, args.mode)
+    db.init_database()
+    mapping = db.get_column_mapping()
+    if not mapping:
+        print("No column mapping saved. Configure it in Settings first.", file=sys.stderr)
+        return 2
+
+    files = collect_files(args.inputs, args.pattern)
+    if not files:
+        print("No input files found.", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    results = run_batch(files, mapping, args.workers, args.chunk_size)
+    print_summary(results, time.perf_counter() - started)
+    return 1 if any(r["error"] for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import argparse
+import gc
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+import duckdb
+import pandas as pd
+
+import charts
+import database as db
+import sample_data_generator as generator
+
+# (markets, ledgers, months) per dataset size; every size spans a full year.
+SIZES = {
+    '10k': (10, 84, 12),
+    '100k': (20, 417, 12),
+    '1m': (50, 1667, 12),
+    '10m': (100, 8334, 12)
+}
+DEFAULT_SIZES = ('10k', '100k', '1m')
+DEFAULT_REPEATS = 3
+DEFAULT_THRESHOLD = 0.20
+MIN_SECONDS = 0.005
+MIN_PEAK_MB = 1.0
+
+# Modules app.py imports before the first page renders, and the heavy ones that must stay deferred.
+STARTUP_MODULES = ('streamlit', 'tracing', 'database', 'cache', 'ingest', 'jobs', 'report', 'sample_data_generator', 'charts')
+DEFERRED_MODULES = ('plotly.express', 'plotly.subplots', 'openpyxl', 'kaleido', 'pypdf')
+IMPORT_BUDGET_SECONDS = 1.0
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {modules}
+print(json.dumps({{"seconds": time.perf_counter() - started,
+                  "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+def measure(func: Callable, repeats: int = DEFAULT_REPEATS) -> dict:
+    """Time ``func`` ``repeats`` times after a warm-up call, then once more under tracemalloc for peak Python heap."""
+    func()
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "peak_mb": peak / 1024 / 1024
+    }
+
+def measure_imports(repeats: int = 5) -> dict:
+    """Time the app's startup imports in fresh interpreters and list any deferred module they pulled in."""
+    probe = IMPORT_PROBE.format(modules=", ".join(STARTUP_MODULES), deferred=DEFERRED_MODULES)
+    runs = []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True,
+                                   cwd=Path(__file__).resolve().parent)
+        runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+    seconds = [r["seconds"] for r in runs]
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+    result = {
+        "seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "budget_seconds": IMPORT_BUDGET_SECONDS,
+        "deferred_loaded": loaded
+    }
+    result["within_budget"] = result["seconds"] <= IMPORT_BUDGET_SECONDS and not loaded
+    print(f"  startup imports {result['seconds']:.3f}s (budget {IMPORT_BUDGET_SECONDS:.2f}s)"
+          + (f", eagerly loaded: {', '.join(loaded)}" if loaded else ""))
+    return result
+
+def benchmark_cases(frame: pd.DataFrame) -> dict:
+    """Return {case name: zero-argument callable} for every reader, query and chart builder."""
+    months = list(frame['month_tag'].cat.categories)
+    current, previous = months[-1], months[-2]
+    current_frame = frame[frame['month_tag'] == current].drop(columns='month_tag')
+    mapping = db.get_column_mapping()
+    revisions = itertools.count(1)
+
+    def save_changed_snapshot():
+        # A different Actual column on every call, so each run diffs and writes rather than being skipped as unchanged.
+        actual = mapping['actual_col']
+        changed = current_frame.assign(**{actual: current_frame[actual] + next(revisions)})
+        return db.save_financial_snapshot(changed, current, mapping)
+
+    inputs = {
+        "scoreboard": db.month_summary(current, 'market'),
+        "variance": db.month_summary(current, 'bucket'),
+        "mom": db.mom_delta(current, previous),
+        "movers": db.top_movers(current, previous, 10),
+        "pareto": db.variance_pareto(current, 'plan'),
+        "trends": db.metric_trend(None, 'actual'),
+        "totals": db.totals_by_month(),
+        "exceptions": db.variance_exceptions(current)
+    }
+    inputs["action_plan"] = charts.create_action_plan_table(inputs["exceptions"])
+    return {
+        "save_financial_snapshot": save_changed_snapshot,
+        "save_financial_snapshot_unchanged": lambda: db.save_financial_snapshot(current_frame, current, mapping),
+        "get_all_snapshots": db.get_all_snapshots,
+        "get_snapshot_by_month": lambda: db.get_snapshot_by_month(current),
+        "month_summary": lambda: db.month_summary(current, 'market'),
+        "mom_delta": lambda: db.mom_delta(current, previous, by='line'),
+        "variance_pareto": lambda: db.variance_pareto(current, 'plan'),
+        "top_movers": lambda: db.top_movers(current, previous, 10),
+        "metric_trend": lambda: db.metric_trend(None, 'actual'),
+        "trend_metrics": lambda: db.trend_metrics('ledger', 'actual'),
+        "variance_exceptions": lambda: db.variance_exceptions(current),
+        "create_market_scoreboard": lambda: charts.create_market_scoreboard(inputs["scoreboard"], current),
+        "create_mom_comparison": lambda: charts.create_mom_comparison(inputs["mom"], current, previous),
+        "create_top_movers": lambda: charts.create_top_movers(inputs["movers"], current, previous, 10),
+        "create_pareto_chart": lambda: charts.create_pareto_chart(inputs["pareto"], current, 'variance_plan'),
+        "create_variance_analysis": lambda: charts.create_variance_analysis(inputs["variance"], current, 'bucket'),
+        "create_trends_chart": lambda: charts.create_trends_chart(inputs["trends"], None, 'actual'),
+        "create_totals_trend": lambda: charts.create_totals_trend(inputs["totals"]),
+        "create_action_plan_table": lambda: charts.create_action_plan_table(inputs["exceptions"]),
+        "create_action_plan_figure": lambda: charts.create_action_plan_figure(inputs["action_plan"], current)
+    }
+
+def run_size(size: str, workdir: Path, repeats: int = DEFAULT_REPEATS, seed: int = 42, only: tuple = ()) -> dict:
+    markets, ledgers, months = SIZES[size]
+    db.configure(workdir / f"bench_{size}.duckdb")
+    try:
+        frame = generator.generate_frame(markets, ledgers, months, seed=seed)
+        started = time.perf_counter()
+        generator.load_into_database(frame)
+        results = {"rows": len(frame), "seed_seconds": time.perf_counter() - started, "cases": {}}
+        for name, func in benchmark_cases(frame).items():
+            if only and name not in only:
+                continue
+            results["cases"][name] = measure(func, repeats)
+            print(f"  {size:>5} {name:<34} {results['cases'][name]['seconds']:>9.4f}s {results['cases'][name]['peak_mb']:>9.1f} MB")
+        return results
+    finally:
+        db.close_connections()
+
+def run(sizes: tuple = DEFAULT_SIZES, repeats: int = DEFAULT_REPEATS, seed: int = 42, only: tuple = ()) -> dict:
+    report = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "duckdb": duckdb.__version__,
+            "pandas": pd.__version__,
+            "repeats": repeats,
+            "seed": seed
+        },
+        "imports": measure_imports(),
+        "sizes": {}
+    }
+    with tempfile.TemporaryDirectory(prefix="fa-bench-") as workdir:
+        for size in sizes:
+            print(f"Seeding {size} ({'x'.join(map(str, SIZES[size]))})...")
+            report["sizes"][size] = run_size(size, Path(workdir), repeats, seed, only)
+    return report
+
+def compare(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Return one row per case measured in both reports, flagging slowdowns or memory growth above ``threshold``."""
+    rows = []
+    if "imports" in baseline and "imports" in current:
+        before, now = baseline["imports"], current["imports"]
+        time_ratio = now["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        rows.append({
+            "size": "-",
+            "case": "startup_imports",
+            "seconds_before": before["seconds"],
+            "seconds_after": now["seconds"],
+            "time_ratio": time_ratio,
+            "peak_mb_before": 0.0,
+            "peak_mb_after": 0.0,
+            "memory_ratio": 1.0,
+            "regression": (time_ratio > 1 + threshold and now["seconds"] - before["seconds"] > MIN_SECONDS)
+                          or not now["within_budget"]
+        })
+    for size, results in current["sizes"].items():
+        base_cases = baseline.get("sizes", {}).get(size, {}).get("cases", {})
+        for name, now in results["cases"].items():
+            before = base_cases.get(name)
+            if before is None:
+                continue
+            time_ratio = now["seconds"] / before["seconds"] if before["seconds"] else 1.0
+            memory_ratio = now["peak_mb"] / before["peak_mb"] if before["peak_mb"] else 1.0
+            slower = time_ratio > 1 + threshold and now["seconds"] - before["seconds"] > MIN_SECONDS
+            heavier = memory_ratio > 1 + threshold and now["peak_mb"] - before["peak_mb"] > MIN_PEAK_MB
+            rows.append({
+                "size": size,
+                "case": name,
+                "seconds_before": before["seconds"],
+                "seconds_after": now["seconds"],
+                "time_ratio": time_ratio,
+                "peak_mb_before": before["peak_mb"],
+                "peak_mb_after": now["peak_mb"],
+                "memory_ratio": memory_ratio,
+                "regression": slower or heavier
+            })
+    return rows
+
+def print_comparison(rows: list, threshold: float):
+    print(f"{'Size':<6} {'Case':<28} {'Before s':>9} {'After s':>9} {'x':>6} {'Before MB':>10} {'After MB':>10} {'x':>6}")
+    for r in rows:
+        flag = "  REGRESSION" if r["regression"] else ""
+        print(f"{r['size']:<6} {r['case']:<28} {r['seconds_before']:>9.4f} {r['seconds_after']:>9.4f} {r['time_ratio']:>6.2f} "
+              f"{r['peak_mb_before']:>10.1f} {r['peak_mb_after']:>10.1f} {r['memory_ratio']:>6.2f}{flag}")
+    regressions = sum(r["regression"] for r in rows)
+    print(f"\n{regressions} regression(s) beyond {threshold:.0%} across {len(rows)} case(s)")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark database readers and chart builders on synthetic data.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(DEFAULT_SIZES))
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="+", default=(), help="Run only these case names")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write this run's JSON results")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="Baseline JSON to compare this run against, or two JSON files to compare without running")
+    parser.add_argument("--imports-only", action="store_true", help="Only check startup import time against the budget")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown / memory growth, e.g. 0.2 for 20%%")
+    args = parser.parse_args(argv)
+
+    if args.imports_only:
+        return 0 if measure_imports()["within_budget"] else 1
+    if args.compare and len(args.compare) > 2:
+        parser.error("--compare takes one baseline file, or a baseline and a current file")
+    if args.compare and len(args.compare) == 2:
+        baseline, current = (json.loads(Path(p).read_text()) for p in args.compare)
+    else:
+        current = run(tuple(args.sizes), args.repeats, args.seed, tuple(args.only))
+        Path(args.output).write_text(json.dumps(current, indent=2))
+        print(f"Results written to {args.output}")
+        if not args.compare:
+            return 0
+        baseline = json.loads(Path(args.compare[0]).read_text())
+
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows, args.threshold)
+    return 1 if any(r["regression"] for r in rows) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
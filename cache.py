@@ -0,0 +1,384 @@
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+import database as db
+import tracing
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_DISK_MAX_BYTES = 512 * 1024 * 1024
+INDEX_LOCK_TIMEOUT = 10.0
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if hasattr(value, "to_json"):
+        try:
+            return len(value.to_json())
+        except Exception:
+            pass
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+class ResultCache:
+    """Process-wide LRU cache whose entries are tagged with the data scopes they were built from.
+
+    Keys embed the version of every scope an entry depends on and the
+    database epoch, so a stale entry can never be served. sync() additionally drops entries for scopes
+    whose version moved, so memory is reclaimed as soon as an upload lands.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._seen_versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def sync(self, versions: dict):
+        with self._lock:
+            if versions == self._seen_versions:
+                return
+            changed = {scope for scope in set(versions) | set(self._seen_versions)
+                       if versions.get(scope) != self._seen_versions.get(scope)}
+            self._seen_versions = dict(versions)
+            stale = [key for key, (_, _, scopes) in self._entries.items() if changed.intersection(scopes)]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+
+    def get(self, key) -> tuple:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value: Any, scopes: tuple = (), size: Optional[int] = None):
+        """Store ``value``; pass ``size`` when it is already known to skip measuring it."""
+        size = _sizeof(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, frozenset(scopes))
+            self._bytes += size
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *scopes: str):
+        with self._lock:
+            stale = [key for key, (_, _, entry_scopes) in self._entries.items() if entry_scopes.intersection(scopes)]
+            for key in stale:
+                self._drop(key)
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+_default_cache = ResultCache()
+
+def get_cache() -> ResultCache:
+    return _default_cache
+
+class FigureStore:
+    """On-disk LRU store for serialized figures and their rendered PNG/PDF exports.
+
+    Files are named by a digest of the function, its arguments and the
+    versions of the scopes it depends on (plus the database epoch). A small
+    JSON index records those scope versions, file sizes and last access per
+    entry, so re-uploaded months are evicted without opening any figure file.
+
+    Several app processes can share the directory: every index write
+    re-reads index.json under a file lock and merges into it, and access
+    times are saved in batches along with the next write.
+    """
+
+    INDEX = "index.json"
+    ACCESS_FLUSH_SECONDS = 30.0
+    ACCESS_FLUSH_ENTRIES = 64
+
+    def __init__(self, directory, max_bytes: int = DEFAULT_DISK_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+        self._accessed = {}
+        self._flushed = time.monotonic()
+        self._seen_versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _read_index(self) -> dict:
+        try:
+            return json.loads((self.directory / self.INDEX).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _load_index(self, refresh: bool = False) -> dict:
+        if self._index is None or refresh:
+            self._index = self._read_index()
+        return self._index
+
+    @contextmanager
+    def _locked_index(self):
+        """Yield the index as saved on disk, with pending access times folded in, and save it afterwards."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with db.process_lock(self.directory / f"{self.INDEX}.lock", INDEX_LOCK_TIMEOUT):
+            index = self._read_index()
+            for key, accessed in self._accessed.items():
+                if key in index:
+                    index[key]["accessed"] = max(index[key]["accessed"], accessed)
+            self._accessed.clear()
+            self._flushed = time.monotonic()
+            self._index = index
+            yield index
+            staging = self.directory / f"{self.INDEX}.tmp"
+            staging.write_text(json.dumps(index), encoding="utf-8")
+            staging.replace(self.directory / self.INDEX)
+
+    def _path(self, key: str, kind: str) -> Path:
+        return self.directory / f"{key}.{kind}"
+
+    def _remove(self, index: dict, key: str):
+        entry = index.pop(key, None)
+        for kind in (entry or {}).get("files", {}):
+            self._path(key, kind).unlink(missing_ok=True)
+
+    def sync(self, versions: dict):
+        with self._lock:
+            if versions == self._seen_versions:
+                return
+            self._seen_versions = dict(versions)
+
+            def is_stale(entry: dict) -> bool:
+                return any(versions.get(scope, 0) != version for scope, version in entry["scopes"].items())
+
+            if not any(is_stale(entry) for entry in self._load_index(refresh=True).values()):
+                return
+            with self._locked_index() as index:
+                stale = [key for key, entry in index.items() if is_stale(entry)]
+                for key in stale:
+                    self._remove(index, key)
+            self.invalidations += len(stale)
+
+    def get(self, key: str, kind: str = "json") -> Optional[bytes]:
+        with self._lock:
+            entry = self._load_index().get(key)
+            if entry is None or kind not in entry["files"]:
+                # Another process may have stored it since the index was read.
+                entry = self._load_index(refresh=True).get(key)
+            if entry is None or kind not in entry["files"]:
+                self.misses += 1
+                return None
+            try:
+                data = self._path(key, kind).read_bytes()
+            except OSError:
+                with self._locked_index() as index:
+                    self._remove(index, key)
+                self.misses += 1
+                return None
+            self._accessed[key] = time.time()
+            self.hits += 1
+            if (len(self._accessed) >= self.ACCESS_FLUSH_ENTRIES
+                    or time.monotonic() - self._flushed >= self.ACCESS_FLUSH_SECONDS):
+                with self._locked_index():
+                    pass
+            return data
+
+    def put(self, key: str, kind: str, data: bytes, scopes: dict):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._path(key, kind).write_bytes(data)
+            with self._locked_index() as index:
+                entry = index.setdefault(key, {"scopes": scopes, "files": {}})
+                entry["files"][kind] = len(data)
+                entry["accessed"] = time.time()
+                total = sum(sum(e["files"].values()) for e in index.values())
+                for victim in sorted(index, key=lambda k: index[k]["accessed"]):
+                    if total <= self.max_bytes:
+                        break
+                    if victim == key:
+                        continue
+                    total -= sum(index[victim]["files"].values())
+                    self._remove(index, victim)
+                    self.evictions += 1
+
+    def clear(self):
+        with self._lock, self._locked_index() as index:
+            for key in list(index):
+                self._remove(index, key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            index = self._load_index()
+            return {
+                "entries": len(index),
+                "bytes": sum(sum(e["files"].values()) for e in index.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
+_figure_stores = {}
+_figure_stores_lock = threading.Lock()
+
+def get_figure_store() -> FigureStore:
+    """The figure store next to the configured database file."""
+    directory = db.DB_PATH.parent / "figure_cache"
+    with _figure_stores_lock:
+        if directory not in _figure_stores:
+            _figure_stores[directory] = FigureStore(directory)
+        return _figure_stores[directory]
+
+def _figure_to_json(figure) -> bytes:
+    return figure.to_json().encode("utf-8")
+
+def _figure_from_json(payload: bytes):
+    import plotly.graph_objects as go
+
+    # The JSON came from an already validated figure; skipping validation makes loading ~20x cheaper than rebuilding.
+    return go.Figure(json.loads(payload), _validate=False)
+
+def _disk_key(func: Callable, arguments: dict, scopes: tuple, versions: dict) -> tuple:
+    scope_versions = {scope: versions.get(scope, 0) for scope in scopes}
+    scope_versions["epoch"] = versions.get("epoch", 0)
+    raw = repr((func.__module__, func.__qualname__, tuple(arguments.items()), sorted(scope_versions.items())))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32], scope_versions
+
+def _resolve_scopes(scopes: tuple, arguments: dict) -> set:
+    resolved = set()
+    for scope in scopes:
+        if callable(scope):
+            resolved.update(scope(arguments))
+        else:
+            resolved.add(scope.format(**arguments))
+    return resolved
+
+def cached(*scopes, cache: Optional[ResultCache] = None, persist: bool = False) -> Callable:
+    """Memoize a function on its arguments plus the data versions of ``scopes``.
+
+    Scopes are format strings resolved against the call arguments, e.g.
+    ``"month:{month_tag}"``, or callables mapping the bound arguments to
+    scope names. ``"snapshots"`` covers every month and ``"ledger_mapping"``
+    / ``"column_mapping"`` the mapping tables.
+
+    With ``persist=True`` the function must return a Plotly figure. Misses
+    then fall through to the on-disk FigureStore before rebuilding, so
+    closed months survive restarts. The wrapper also gains
+    ``export(fmt, render, *args)``, which caches rendered bytes the same way.
+    """
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        def resolve(args: tuple, kwargs: dict) -> tuple:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            resolved = tuple(sorted(_resolve_scopes(scopes, bound.arguments)))
+            return bound, resolved, db.get_data_versions()
+
+        def load_or_build(bound, resolved: tuple, versions: dict, args: tuple, kwargs: dict) -> tuple:
+            """(figure, size of its JSON), the size doubling as the in-memory cost so it is not serialized twice."""
+            store = get_figure_store()
+            store.sync(versions)
+            key, scope_versions = _disk_key(func, bound.arguments, resolved, versions)
+            payload = store.get(key, "json")
+            if payload is not None:
+                return _figure_from_json(payload), len(payload)
+            figure = func(*args, **kwargs)
+            payload = _figure_to_json(figure)
+            store.put(key, "json", payload, scope_versions)
+            return figure, len(payload)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            target = cache or _default_cache
+            bound, resolved, versions = resolve(args, kwargs)
+            target.sync(versions)
+            key = (
+                func.__module__,
+                func.__qualname__,
+                tuple(bound.arguments.items()),
+                tuple(versions.get(scope, 0) for scope in resolved),
+                versions.get("epoch", 0)
+            )
+            with tracing.span(func.__qualname__, "cache") as entry:
+                hit, value = target.get(key)
+                entry["args"]["hit"] = hit
+                if hit:
+                    return value
+                size = None
+                if persist:
+                    value, size = load_or_build(bound, resolved, versions, args, kwargs)
+                else:
+                    value = func(*args, **kwargs)
+                target.put(key, value, resolved + ("epoch",), size)
+                return value
+
+        def export(fmt: str, render: Callable, *args, **kwargs) -> bytes:
+            """Rendered ``fmt`` bytes of this figure, from disk when the data has not changed."""
+            bound, resolved, versions = resolve(args, kwargs)
+            store = get_figure_store()
+            store.sync(versions)
+            key, scope_versions = _disk_key(func, bound.arguments, resolved, versions)
+            data = store.get(key, fmt)
+            if data is None:
+                data = render(wrapper(*args, **kwargs))
+                store.put(key, fmt, data, scope_versions)
+            return data
+
+        wrapper.uncached = func
+        if persist:
+            wrapper.export = export
+        return wrapper
+    return decorator
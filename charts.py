@@ -1,9 +1,16 @@
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 import pandas as pd
 import numpy as np
 
+import tracing
+
+# Plotly is imported inside each builder so pages that draw no chart never pay for loading it.
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
 COLORS = {
     'primary': '#0066CC',
     'secondary': '#00A86B',
@@ -17,22 +24,87 @@ COLORS = {
 
 PALETTE = ['#0066CC', '#00A86B', '#FF6B35', '#9B59B6', '#F39C12', '#1ABC9C', '#E74C3C', '#3498DB']
 
-def format_currency(value):
-    if abs(value) >= 1e6:
-        return f"${value/1e6:.1f}M"
-    elif abs(value) >= 1e3:
-        return f"${value/1e3:.1f}K"
-    return f"${value:.0f}"
+# trend_metrics column -> (legend label, line dash); growth overlays are drawn as bars on a % axis.
+TREND_OVERLAYS = {
+    'ma_3': ('3-month avg', 'dot'),
+    'ma_6': ('6-month avg', 'dash'),
+    'ma_12': ('12-month avg', 'longdash'),
+    'mom_pct': ('MoM growth %', None),
+    'yoy_pct': ('YoY growth %', None)
+}
 
-def create_market_scoreboard(df: pd.DataFrame, selected_month: str) -> go.Figure:
-    month_data = df[df['month_tag'] == selected_month].copy()
-    
-    market_summary = month_data.groupby('market').agg({
-        'actual': 'sum',
-        'plan': 'sum',
-        'forecast': 'sum'
-    }).reset_index()
+# (|variance %| strictly above, label); anything below every threshold is 'Low'.
+PRIORITY_BANDS = ((15.0, 'High'), (10.0, 'Medium'))
+
+# (divisor, suffix, decimals) from smallest to largest; an amount uses the largest divisor it reaches.
+CURRENCY_SCALES = ((1.0, '', 0), (1e3, 'K', 1), (1e6, 'M', 1), (1e9, 'B', 1))
+_DIVISORS = np.array([scale[0] for scale in CURRENCY_SCALES])
+_DECIMALS = np.array([scale[2] for scale in CURRENCY_SCALES])
+
+def _render_codes(codes: np.ndarray, render) -> np.ndarray:
+    """Render each distinct integer code once and broadcast the labels back; code -1 means n/a."""
+    unique, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array([render(int(code)) if code >= 0 else 'n/a' for code in unique], dtype=object)
+    return labels[inverse.reshape(codes.shape)]
+
+def _as_labels(labels: np.ndarray, value, scalar: bool):
+    if scalar:
+        return labels.flat[0]
+    if isinstance(value, pd.Series):
+        return pd.Series(labels, index=value.index, name=value.name)
+    return labels
+
+def _half_up(values: np.ndarray) -> np.ndarray:
+    return np.floor(values + 0.5)
+
+def format_currency(value, symbol: str = '$'):
+    """Format one amount or a whole array/Series as e.g. ``$950``, ``-$12.5K``, ``$1.2M``, ``$3.4B``.
+
+    Scalars return a str, Series return a Series on the same index and other
+    array-likes an object array. Amounts are rounded to the displayed unit
+    first, so labels repeat heavily and each distinct one is formatted once.
+    """
+    scalar = np.ndim(value) == 0
+    amounts = np.atleast_1d(np.asarray(value, dtype=float))
+    finite = np.isfinite(amounts) & (np.abs(amounts) < 1e18)
+    magnitude = np.where(finite, np.abs(amounts), 0.0)
+
+    level = np.maximum(np.searchsorted(_DIVISORS, magnitude, side='right') - 1, 0)
+    units = _half_up(magnitude / _DIVISORS[level] * 10.0 ** _DECIMALS[level])
+    # Promote values that round up into the next unit, e.g. 999,960 -> $1.0M rather than $1000.0K.
+    level = np.where((units >= 1000 * 10.0 ** _DECIMALS[level]) & (level < len(CURRENCY_SCALES) - 1), level + 1, level)
+    units = _half_up(magnitude / _DIVISORS[level] * 10.0 ** _DECIMALS[level]).astype(np.int64)
+    negative = (amounts < 0) & (units > 0)
+    codes = np.where(finite, (units * len(CURRENCY_SCALES) + level) * 2 + negative, -1)
+
+    def render(code: int) -> str:
+        units, level = divmod(code >> 1, len(CURRENCY_SCALES))
+        _, suffix, decimals = CURRENCY_SCALES[level]
+        return f"{'-' if code & 1 else ''}{symbol}{units / 10 ** decimals:.{decimals}f}{suffix}"
+
+    return _as_labels(_render_codes(codes, render), value, scalar)
+
+def format_percent(value, signed: bool = True):
+    """Vectorized ``f"{v:+.1f}%"`` (or unsigned), with ``n/a`` for missing or infinite values."""
+    scalar = np.ndim(value) == 0
+    pct = np.atleast_1d(np.asarray(value, dtype=float))
+    finite = np.isfinite(pct) & (np.abs(pct) < 1e15)
+    tenths = _half_up(np.where(finite, np.abs(pct), 0.0) * 10).astype(np.int64)
+    negative = (pct < 0) & (tenths > 0)
+    codes = np.where(finite, tenths * 2 + negative, -1)
+
+    def render(code: int) -> str:
+        sign = '-' if code & 1 else ('+' if signed else '')
+        return f"{sign}{(code >> 1) / 10:.1f}%"
+
+    return _as_labels(_render_codes(codes, render), value, scalar)
+
+@tracing.traced("chart")
+def create_market_scoreboard(market_summary: pd.DataFrame, selected_month: str) -> go.Figure:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     
+    market_summary = market_summary.copy()
     market_summary['vs_plan'] = ((market_summary['actual'] - market_summary['plan']) / abs(market_summary['plan']) * 100).round(1)
     market_summary['vs_forecast'] = ((market_summary['actual'] - market_summary['forecast']) / abs(market_summary['forecast']) * 100).round(1)
     market_summary = market_summary.sort_values('actual', ascending=True)
@@ -52,7 +124,7 @@ def create_market_scoreboard(df: pd.DataFrame, selected_month: str) -> go.Figure
             x=market_summary['actual'],
             orientation='h',
             marker_color=colors,
-            text=[format_currency(v) for v in market_summary['actual']],
+            text=format_currency(market_summary['actual'].to_numpy()),
             textposition='outside',
             name='Actual'
         ),
@@ -66,7 +138,7 @@ def create_market_scoreboard(df: pd.DataFrame, selected_month: str) -> go.Figure
             x=market_summary['vs_plan'],
             orientation='h',
             marker_color=plan_colors,
-            text=[f"{v:+.1f}%" for v in market_summary['vs_plan']],
+            text=format_percent(market_summary['vs_plan'].to_numpy()),
             textposition='outside',
             name='vs Plan'
         ),
@@ -80,7 +152,7 @@ def create_market_scoreboard(df: pd.DataFrame, selected_month: str) -> go.Figure
             x=market_summary['vs_forecast'],
             orientation='h',
             marker_color=forecast_colors,
-            text=[f"{v:+.1f}%" for v in market_summary['vs_forecast']],
+            text=format_percent(market_summary['vs_forecast'].to_numpy()),
             textposition='outside',
             name='vs Forecast'
         ),
@@ -103,21 +175,11 @@ def create_market_scoreboard(df: pd.DataFrame, selected_month: str) -> go.Figure
     
     return fig
 
-def create_mom_comparison(df: pd.DataFrame, current_month: str, previous_month: str, market: str = None) -> go.Figure:
-    current = df[df['month_tag'] == current_month].copy()
-    previous = df[df['month_tag'] == previous_month].copy()
-    
-    if market:
-        current = current[current['market'] == market]
-        previous = previous[previous['market'] == market]
-    
-    current_agg = current.groupby('ledger')['actual'].sum().reset_index()
-    previous_agg = previous.groupby('ledger')['actual'].sum().reset_index()
+@tracing.traced("chart")
+def create_mom_comparison(ledger_delta: pd.DataFrame, current_month: str, previous_month: str, market: str = None) -> go.Figure:
+    import plotly.graph_objects as go
     
-    merged = current_agg.merge(previous_agg, on='ledger', suffixes=('_current', '_previous'))
-    merged['change'] = merged['actual_current'] - merged['actual_previous']
-    merged['pct_change'] = ((merged['change'] / abs(merged['actual_previous'])) * 100).round(1)
-    merged = merged.sort_values('change', ascending=True)
+    merged = ledger_delta.sort_values('change', ascending=True)
     
     colors = [COLORS['positive'] if v >= 0 else COLORS['negative'] for v in merged['change']]
     
@@ -128,7 +190,7 @@ def create_mom_comparison(df: pd.DataFrame, current_month: str, previous_month:
         x=merged['change'],
         orientation='h',
         marker_color=colors,
-        text=[f"{format_currency(v)} ({p:+.1f}%)" for v, p in zip(merged['change'], merged['pct_change'])],
+        text=format_currency(merged['change'].to_numpy()) + ' (' + format_percent(merged['pct_change'].to_numpy()) + ')',
         textposition='outside'
     ))
     
@@ -150,22 +212,16 @@ def create_mom_comparison(df: pd.DataFrame, current_month: str, previous_month:
     
     return fig
 
-def create_top_movers(df: pd.DataFrame, current_month: str, previous_month: str, top_n: int = 10) -> go.Figure:
-    current = df[df['month_tag'] == current_month].copy()
-    previous = df[df['month_tag'] == previous_month].copy()
+@tracing.traced("chart")
+def create_top_movers(movers: pd.DataFrame, current_month: str, previous_month: str, top_n: int = 10) -> go.Figure:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     
-    current['key'] = current['market'] + ' | ' + current['ledger']
-    previous['key'] = previous['market'] + ' | ' + previous['ledger']
+    movers = movers[['market', 'ledger', 'change', 'side']].copy()
+    movers['key'] = movers['market'].astype(str) + ' | ' + movers['ledger'].astype(str)
     
-    merged = current[['key', 'actual']].merge(
-        previous[['key', 'actual']], 
-        on='key', 
-        suffixes=('_current', '_previous')
-    )
-    merged['change'] = merged['actual_current'] - merged['actual_previous']
-    
-    top_positive = merged.nlargest(top_n, 'change')
-    top_negative = merged.nsmallest(top_n, 'change')
+    top_positive = movers[movers['side'] == 'gainer'].head(top_n)
+    top_negative = movers[movers['side'] == 'decliner'].head(top_n)
     
     fig = make_subplots(rows=1, cols=2, subplot_titles=(f'Top {top_n} Gainers', f'Top {top_n} Decliners'))
     
@@ -175,7 +231,7 @@ def create_top_movers(df: pd.DataFrame, current_month: str, previous_month: str,
             x=top_positive['change'],
             orientation='h',
             marker_color=COLORS['positive'],
-            text=[format_currency(v) for v in top_positive['change']],
+            text=format_currency(top_positive['change'].to_numpy()),
             textposition='outside'
         ),
         row=1, col=1
@@ -187,7 +243,7 @@ def create_top_movers(df: pd.DataFrame, current_month: str, previous_month: str,
             x=top_negative['change'],
             orientation='h',
             marker_color=COLORS['negative'],
-            text=[format_currency(v) for v in top_negative['change']],
+            text=format_currency(top_negative['change'].to_numpy()),
             textposition='outside'
         ),
         row=1, col=2
@@ -207,25 +263,18 @@ def create_top_movers(df: pd.DataFrame, current_month: str, previous_month: str,
     
     return fig
 
-def create_pareto_chart(df: pd.DataFrame, month: str, metric: str = 'variance_plan') -> go.Figure:
-    month_data = df[df['month_tag'] == month].copy()
+@tracing.traced("chart")
+def create_pareto_chart(pareto: pd.DataFrame, month: str, metric: str = 'variance_plan') -> go.Figure:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
     
     if metric == 'variance_plan':
-        month_data['variance'] = month_data['actual'] - month_data['plan']
         title = "Pareto: Actual vs Plan Variance"
     else:
-        month_data['variance'] = month_data['actual'] - month_data['forecast']
         title = "Pareto: Actual vs Forecast Variance"
     
-    month_data['key'] = month_data['market'] + ' | ' + month_data['ledger']
-    month_data['abs_variance'] = abs(month_data['variance'])
-    month_data = month_data.sort_values('abs_variance', ascending=False)
-    
-    month_data['cumulative'] = month_data['abs_variance'].cumsum()
-    total = month_data['abs_variance'].sum()
-    month_data['cumulative_pct'] = (month_data['cumulative'] / total * 100)
-    
-    top_20 = month_data.head(20)
+    top_20 = pareto.head(20).copy()
+    top_20['key'] = top_20['market'] + ' | ' + top_20['ledger']
     
     fig = make_subplots(specs=[[{"secondary_y": True}]])
     
@@ -237,7 +286,7 @@ def create_pareto_chart(df: pd.DataFrame, month: str, metric: str = 'variance_pl
             y=top_20['variance'],
             marker_color=colors,
             name='Variance',
-            text=[format_currency(v) for v in top_20['variance']],
+            text=format_currency(top_20['variance'].to_numpy()),
             textposition='outside'
         ),
         secondary_y=False
@@ -275,20 +324,12 @@ def create_pareto_chart(df: pd.DataFrame, month: str, metric: str = 'variance_pl
     
     return fig
 
-def create_variance_analysis(df: pd.DataFrame, month: str, by: str = 'bucket') -> go.Figure:
-    month_data = df[df['month_tag'] == month].copy()
-    
-    if by == 'bucket' and 'bucket' in month_data.columns:
-        group_col = 'bucket'
-    else:
-        group_col = 'market'
-    
-    summary = month_data.groupby(group_col).agg({
-        'actual': 'sum',
-        'plan': 'sum',
-        'forecast': 'sum'
-    }).reset_index()
+@tracing.traced("chart")
+def create_variance_analysis(summary: pd.DataFrame, month: str, by: str = 'bucket') -> go.Figure:
+    import plotly.graph_objects as go
     
+    group_col = by if by in summary.columns else summary.columns[0]
+    summary = summary.copy()
     summary['var_plan'] = summary['actual'] - summary['plan']
     summary['var_forecast'] = summary['actual'] - summary['forecast']
     summary = summary.sort_values('actual', ascending=True)
@@ -337,21 +378,14 @@ def create_variance_analysis(df: pd.DataFrame, month: str, by: str = 'bucket') -
     
     return fig
 
-def create_trends_chart(df: pd.DataFrame, market: str = None, metric: str = 'actual') -> go.Figure:
-    if market:
-        data = df[df['market'] == market].copy()
-        title_suffix = f" — {market}"
-    else:
-        data = df.copy()
-        title_suffix = " — All Markets"
+@tracing.traced("chart")
+def create_trends_chart(trend_data: pd.DataFrame, market: str = None, metric: str = 'actual',
+                        metrics: pd.DataFrame = None, overlays: tuple = ()) -> go.Figure:
+    import plotly.express as px
+    import plotly.graph_objects as go
     
-    if 'bucket' in data.columns and data['bucket'].notna().any():
-        trend_data = data.groupby(['month_tag', 'bucket'])[metric].sum().reset_index()
-        color_col = 'bucket'
-    else:
-        trend_data = data.groupby(['month_tag', 'ledger'])[metric].sum().reset_index()
-        trend_data = trend_data[trend_data['ledger'].isin(trend_data.groupby('ledger')[metric].sum().nlargest(8).index)]
-        color_col = 'ledger'
+    title_suffix = f" — {market}" if market else " — All Markets"
+    color_col = 'bucket' if 'bucket' in trend_data.columns else 'ledger'
     
     fig = px.line(
         trend_data,
@@ -362,6 +396,23 @@ def create_trends_chart(df: pd.DataFrame, market: str = None, metric: str = 'act
         color_discrete_sequence=PALETTE
     )
     
+    # Moving averages per group, in the group's colour; growth overlays only apply to the totals chart.
+    if metrics is not None and not metrics.empty:
+        for i, group in enumerate(trend_data[color_col].unique()):
+            rows = metrics[metrics[color_col] == group]
+            for column in overlays:
+                label, dash = TREND_OVERLAYS[column]
+                if dash is None:
+                    continue
+                fig.add_trace(go.Scatter(
+                    x=rows['month_tag'],
+                    y=rows[column],
+                    name=f"{group} ({label})",
+                    legendgroup=str(group),
+                    mode='lines',
+                    line=dict(color=PALETTE[i % len(PALETTE)], width=1.5, dash=dash)
+                ))
+    
     fig.update_layout(
         title_text=f"Trend Analysis: {metric.title()}{title_suffix}",
         title_x=0.5,
@@ -380,12 +431,11 @@ def create_trends_chart(df: pd.DataFrame, market: str = None, metric: str = 'act
     
     return fig
 
-def create_totals_trend(df: pd.DataFrame) -> go.Figure:
-    trend = df.groupby('month_tag').agg({
-        'actual': 'sum',
-        'plan': 'sum',
-        'forecast': 'sum'
-    }).reset_index().sort_values('month_tag')
+@tracing.traced("chart")
+def create_totals_trend(totals: pd.DataFrame, metrics: pd.DataFrame = None, overlays: tuple = ()) -> go.Figure:
+    import plotly.graph_objects as go
+    
+    trend = totals.sort_values('month_tag')
     
     fig = go.Figure()
     
@@ -416,6 +466,33 @@ def create_totals_trend(df: pd.DataFrame) -> go.Figure:
         marker=dict(size=10)
     ))
     
+    # Overlays come from trend_metrics('total', 'actual'): averages on the amount axis, growth on a % axis.
+    growth = False
+    if metrics is not None and not metrics.empty:
+        for i, column in enumerate(overlays):
+            label, dash = TREND_OVERLAYS[column]
+            if dash is None:
+                growth = True
+                fig.add_trace(go.Bar(
+                    x=metrics['month_tag'],
+                    y=metrics[column],
+                    name=label,
+                    yaxis='y2',
+                    opacity=0.35,
+                    marker_color=PALETTE[(i + 3) % len(PALETTE)]
+                ))
+            else:
+                fig.add_trace(go.Scatter(
+                    x=metrics['month_tag'],
+                    y=metrics[column],
+                    name=f"Actual {label}",
+                    mode='lines',
+                    line=dict(color=COLORS['secondary'], width=2, dash=dash)
+                ))
+    if growth:
+        fig.update_layout(yaxis2=dict(title="Growth %", overlaying='y', side='right', showgrid=False,
+                                      ticksuffix='%', zeroline=True))
+    
     fig.update_layout(
         title_text="Total Performance Trend: Actual vs Plan vs Forecast",
         title_x=0.5,
@@ -435,26 +512,74 @@ def create_totals_trend(df: pd.DataFrame) -> go.Figure:
     
     return fig
 
-def create_action_plan_table(df: pd.DataFrame, month: str, threshold_pct: float = 5.0) -> pd.DataFrame:
-    month_data = df[df['month_tag'] == month].copy()
-    
-    month_data['var_plan'] = month_data['actual'] - month_data['plan']
-    month_data['var_plan_pct'] = ((month_data['var_plan'] / abs(month_data['plan'])) * 100).round(1)
-    
-    issues = month_data[abs(month_data['var_plan_pct']) > threshold_pct].copy()
-    issues = issues.sort_values('var_plan', ascending=True)
+def assign_priority(variance_pct, bands: tuple = PRIORITY_BANDS, default: str = 'Low') -> np.ndarray:
+    """Label each |variance %| with the first band whose threshold it exceeds, checking the highest threshold first."""
+    magnitude = np.abs(np.asarray(variance_pct, dtype=float))
+    ordered = sorted(bands, key=lambda band: band[0], reverse=True)
+    return np.select([magnitude > threshold for threshold, _ in ordered], [label for _, label in ordered], default=default)
+
+@tracing.traced("chart")
+def create_action_plan_table(exceptions: pd.DataFrame, basis: str = 'plan', bands: tuple = PRIORITY_BANDS,
+                             top_n: int = 20) -> pd.DataFrame:
+    var_col, pct_col = f'var_{basis}', f'var_{basis}_pct'
+    issues = exceptions.nsmallest(top_n, var_col)
+    
+    unfavorable = issues[var_col].to_numpy() < 0
+    ledger = issues['ledger'].astype(str)
+    market = issues['market'].astype(str)
+    investigate = ("Investigate " + ledger + " in " + market).to_numpy()
+    document = ("Document success in " + ledger + " — " + market).to_numpy()
+    
+    return pd.DataFrame({
+        'Market': market.to_numpy(),
+        'Ledger': ledger.to_numpy(),
+        'Actual': issues['actual'].to_numpy(),
+        basis.title(): issues[basis].to_numpy(),
+        'Variance': issues[var_col].to_numpy(),
+        'Var %': issues[pct_col].to_numpy(),
+        'Status': np.where(unfavorable, '🔴 Unfavorable', '🟢 Favorable').astype(object),
+        'Priority': assign_priority(issues[pct_col], bands).astype(object),
+        'Action': np.where(unfavorable, investigate, document)
+    })
+
+@tracing.traced("chart")
+def create_action_plan_figure(action_plan: pd.DataFrame, month: str, basis: str = 'plan') -> go.Figure:
+    """The action-plan table as a Plotly figure, for static exports where no dataframe widget exists."""
+    import plotly.graph_objects as go
+    
+    table = action_plan.copy()
+    for column in ('Actual', basis.title(), 'Variance'):
+        table[column] = format_currency(table[column])
+    table['Var %'] = format_percent(table['Var %'])
+    table['Status'] = table['Status'].str.split(' ', n=1).str[-1]
+    priority_fill = {'High': '#F8D7DA', 'Medium': '#FFF3CD'}
+    row_fill = table['Priority'].map(priority_fill).fillna('white').tolist()
+    
+    fig = go.Figure(go.Table(
+        columnwidth=[1.2, 1.6, 0.8, 0.8, 0.8, 0.6, 0.9, 0.6, 2.6],
+        header=dict(
+            values=[f"<b>{column}</b>" for column in table.columns],
+            fill_color=COLORS['primary'],
+            font=dict(color='white', size=11),
+            align='left'
+        ),
+        cells=dict(
+            values=[table[column].tolist() for column in table.columns],
+            fill_color=[row_fill] * len(table.columns),
+            font=dict(size=10),
+            align='left',
+            height=24
+        )
+    ))
     
-    issues['Status'] = issues['var_plan'].apply(lambda x: '🔴 Unfavorable' if x < 0 else '🟢 Favorable')
-    issues['Priority'] = issues['var_plan_pct'].apply(
-        lambda x: 'High' if abs(x) > 15 else ('Medium' if abs(x) > 10 else 'Low')
-    )
-    issues['Suggested Action'] = issues.apply(
-        lambda row: f"Investigate {row['ledger']} in {row['market']}" if row['var_plan'] < 0 
-        else f"Document success in {row['ledger']} — {row['market']}", axis=1
+    fig.update_layout(
+        title_text=f"Action Plan: Largest Variances vs {basis.title()} - {month}",
+        title_x=0.5,
+        title_font_size=16,
+        height=720,
+        paper_bgcolor='white',
+        font=dict(family="Arial", size=11),
+        margin=dict(l=30, r=30, t=60, b=20)
     )
     
-    result = issues[['market', 'ledger', 'actual', 'plan', 'var_plan', 'var_plan_pct', 'Status', 'Priority', 'Suggested Action']].copy()
-    result.columns = ['Market', 'Ledger', 'Actual', 'Plan', 'Variance', 'Var %', 'Status', 'Priority', 'Action']
-    
-    return result.head(20)
-
+    return fig
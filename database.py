@@ -1,26 +1,408 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
 import duckdb
 import pandas as pd
 from pathlib import Path
-from typing import Optional
+from typing import Callable, ContextManager, Iterable, Optional
+
+import tracing
 
 DB_PATH = Path("data/financial_analytics.duckdb")
+DB_MODES = ('single', 'shared')
+DB_MODE = os.environ.get("FA_DB_MODE", "single")
+WRITE_LOCK_TIMEOUT = 120.0
+KEEP_REPLICAS = 3
+
+if os.name == "nt":
+    import msvcrt
+
+    def _try_lock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+
+    def _unlock_file(handle):
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock_file(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock_file(handle):
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+def _backoff(timeout: float, first: float = 0.01, cap: float = 0.5):
+    """Yield successive sleep intervals, doubling up to ``cap``, until ``timeout`` seconds have passed."""
+    deadline = time.monotonic() + timeout
+    delay = first
+    while time.monotonic() + delay < deadline:
+        yield delay
+        delay = min(delay * 2, cap)
+
+@contextmanager
+def process_lock(path: Path, timeout: float):
+    """Exclusive advisory lock on ``path`` shared by every process on this machine."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as handle:
+        retries = _backoff(timeout)
+        while True:
+            try:
+                _try_lock_file(handle)
+                break
+            except OSError:
+                delay = next(retries, None)
+                if delay is None:
+                    raise TimeoutError(f"Timed out after {timeout:.0f}s waiting for the lock {path}")
+                time.sleep(delay)
+        try:
+            yield
+        finally:
+            _unlock_file(handle)
+
+class _TimedConnection:
+    """The write connection, with each execute() timed for the slow query log."""
+
+    def __init__(self, conn: duckdb.DuckDBPyConnection):
+        self._conn = conn
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+    def execute(self, sql: str, params=None):
+        started = time.perf_counter()
+        result = self._conn.execute(sql, params)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if _slow_query_settings["enabled"] and elapsed_ms >= _slow_query_settings["threshold_ms"]:
+            _record_slow_query("write", sql, params, elapsed_ms)
+        return result
+
+class ConnectionManager:
+    """Process-wide DuckDB handle: one long-lived write connection plus per-thread read cursors."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn = None
+        self._write_conn = None
+        self._open_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._local = threading.local()
+        self._generation = 0
+
+    def _open(self) -> int:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = duckdb.connect(str(self.path))
+            self._write_conn = _TimedConnection(self._conn.cursor())
+            self._generation += 1
+        return self._generation
+
+    def reader(self) -> duckdb.DuckDBPyConnection:
+        if getattr(self._local, "generation", None) != self._generation or self._conn is None:
+            with self._open_lock:
+                self._local.generation = self._open()
+                self._local.cursor = self._conn.cursor()
+        return self._local.cursor
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            with self._open_lock:
+                self._open()
+            yield self._write_conn
+
+    @contextmanager
+    def transaction(self):
+        with self.writer() as con:
+            con.execute("BEGIN TRANSACTION")
+            try:
+                yield con
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+
+    def close(self):
+        with self._write_lock, self._open_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._write_conn = None
+
+class SharedConnectionManager(ConnectionManager):
+    """Multi-process mode: one serialized writer on the primary file, readers on read-only replicas.
+
+    DuckDB lets a single process open a file read-write and locks every
+    other process out meanwhile. So a writer takes ``<db>.lock``, opens the
+    primary only for the duration of the write (retrying with backoff while
+    another program holds it), checkpoints, and copies the file to a new
+    ``replicas/<name>.<n>.duckdb`` before moving ``replicas/current`` to it.
+    Readers query the newest replica read-only and switch on their next
+    query once the pointer moves, so they never wait for a writer.
+    """
+
+    def __init__(self, path: Path, lock_timeout: float = WRITE_LOCK_TIMEOUT):
+        super().__init__(path)
+        self.lock_timeout = lock_timeout
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.replica_dir = self.path.parent / "replicas"
+        self._write_depth = 0
+        self._replica_version = None
+
+    def _replica_path(self, version: int) -> Path:
+        return self.replica_dir / f"{self.path.stem}.{version}{self.path.suffix}"
+
+    def replica_version(self) -> Optional[int]:
+        try:
+            return int((self.replica_dir / "current").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _open(self) -> int:
+        if self._conn is None:
+            raise RuntimeError("No replica opened yet")
+        return self._generation
+
+    def reader(self) -> duckdb.DuckDBPyConnection:
+        version = self.replica_version()
+        if version is None:
+            with self.writer():
+                pass
+            version = self.replica_version()
+        if version != self._replica_version:
+            with self._open_lock:
+                if version != self._replica_version:
+                    try:
+                        conn = duckdb.connect(str(self._replica_path(version)), read_only=True)
+                    except duckdb.IOException:
+                        # Pruned between reading the pointer and opening it; the pointer has moved on.
+                        version = self.replica_version()
+                        conn = duckdb.connect(str(self._replica_path(version)), read_only=True)
+                    # The previous connection is dropped, not closed: other threads may still be reading from it.
+                    self._conn = conn
+                    self._replica_version = version
+                    self._generation += 1
+        return super().reader()
+
+    def _connect_primary(self) -> duckdb.DuckDBPyConnection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        retries = _backoff(self.lock_timeout, first=0.05, cap=1.0)
+        while True:
+            try:
+                return duckdb.connect(str(self.path))
+            except duckdb.IOException as e:
+                delay = next(retries, None)
+                if "lock" not in str(e).lower() or delay is None:
+                    raise
+                time.sleep(delay)
+
+    def _publish_replica(self):
+        self.replica_dir.mkdir(parents=True, exist_ok=True)
+        version = (self.replica_version() or 0) + 1
+        target = self._replica_path(version)
+        staging = target.with_name(target.name + ".tmp")
+        shutil.copyfile(self.path, staging)
+        os.replace(staging, target)
+        pointer = self.replica_dir / "current.tmp"
+        pointer.write_text(str(version), encoding="utf-8")
+        os.replace(pointer, self.replica_dir / "current")
+        for old in self.replica_dir.glob(f"{self.path.stem}.*{self.path.suffix}"):
+            number = old.name[len(self.path.stem) + 1:-len(self.path.suffix) or None]
+            if number.isdigit() and int(number) <= version - KEEP_REPLICAS:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield self._write_conn
+                finally:
+                    self._write_depth -= 1
+                return
+            with process_lock(self.lock_path, self.lock_timeout):
+                conn = self._connect_primary()
+                self._write_conn = _TimedConnection(conn)
+                self._write_depth = 1
+                try:
+                    yield self._write_conn
+                finally:
+                    self._write_depth = 0
+                    self._write_conn = None
+                    try:
+                        conn.execute("CHECKPOINT")
+                    finally:
+                        conn.close()
+                    self._publish_replica()
+
+    def close(self):
+        with self._write_lock, self._open_lock:
+            self._conn = None
+            self._replica_version = None
+
+def _make_manager(path: Path, mode: str) -> ConnectionManager:
+    if mode not in DB_MODES:
+        raise ValueError(f"Database mode must be one of {', '.join(DB_MODES)}, not {mode!r}")
+    return SharedConnectionManager(path) if mode == 'shared' else ConnectionManager(path)
+
+_manager = _make_manager(DB_PATH, DB_MODE)
+
+def configure(db_path, mode: Optional[str] = None) -> None:
+    """Point the module at ``db_path``; ``mode`` is 'single' (one process) or 'shared' (many processes)."""
+    global DB_PATH, DB_MODE, _manager, _slow_query_lines
+    _manager.close()
+    DB_PATH = Path(db_path)
+    DB_MODE = mode or DB_MODE
+    _manager = _make_manager(DB_PATH, DB_MODE)
+    _slow_query_lines = None
+
+def close_connections() -> None:
+    _manager.close()
+
+def _sql_label(sql: str) -> str:
+    return " ".join(sql.split())[:240]
+
+SLOW_QUERY_DEFAULTS = {"enabled": False, "threshold_ms": 200.0, "max_entries": 500}
+_slow_query_settings = dict(SLOW_QUERY_DEFAULTS)
+_slow_query_lock = threading.Lock()
+_slow_query_lines = None
+
+def _slow_query_path() -> Path:
+    return DB_PATH.parent / "slow_queries.jsonl"
+
+def configure_slow_query_log(enabled: Optional[bool] = None, threshold_ms: Optional[float] = None,
+                             max_entries: Optional[int] = None) -> dict:
+    updates = {"enabled": enabled, "threshold_ms": threshold_ms, "max_entries": max_entries}
+    _slow_query_settings.update({k: v for k, v in updates.items() if v is not None})
+    return dict(_slow_query_settings)
+
+def _explain_analyze(cursor, sql: str, params: Optional[list]) -> str:
+    try:
+        return "\n".join(row[1] for row in cursor.execute(f"EXPLAIN ANALYZE {sql}", params).fetchall())
+    except duckdb.Error as e:
+        return f"EXPLAIN ANALYZE failed: {e}"
+
+def _record_slow_query(kind: str, sql: str, params: Optional[list], elapsed_ms: float,
+                       rows: Optional[int] = None, plan: Optional[str] = None):
+    """Append one entry to the JSONL log, trimming it to the newest ``max_entries`` lines as it grows.
+
+    ``kind`` is 'read' or 'write'. Only reads come with a plan: replaying a
+    write under EXPLAIN ANALYZE would apply it twice.
+    """
+    global _slow_query_lines
+    entry = {
+        "logged_at": datetime.now().isoformat(timespec="milliseconds"),
+        "kind": kind,
+        "elapsed_ms": round(elapsed_ms, 3),
+        "rows": rows,
+        "sql": sql.strip(),
+        "params": list(params) if params else [],
+        "plan": plan
+    }
+    path = _slow_query_path()
+    max_entries = _slow_query_settings["max_entries"]
+    with _slow_query_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if _slow_query_lines is None:
+            _slow_query_lines = sum(1 for _ in path.open(encoding="utf-8")) if path.exists() else 0
+        with path.open("a", encoding="utf-8") as log:
+            log.write(json.dumps(entry, default=str) + "\n")
+        _slow_query_lines += 1
+        if _slow_query_lines > 2 * max_entries:
+            kept = path.read_text(encoding="utf-8").splitlines()[-max_entries:]
+            path.write_text("\n".join(kept) + "\n", encoding="utf-8")
+            _slow_query_lines = len(kept)
+
+def get_slow_queries(limit: int = 200) -> pd.DataFrame:
+    path = _slow_query_path()
+    columns = ["logged_at", "kind", "elapsed_ms", "rows", "sql", "params", "plan"]
+    if not path.exists():
+        return pd.DataFrame(columns=columns)
+    with _slow_query_lock:
+        lines = path.read_text(encoding="utf-8").splitlines()[-limit:]
+    entries = [json.loads(line) for line in reversed(lines) if line.strip()]
+    return pd.DataFrame(entries, columns=columns)
+
+def clear_slow_queries():
+    global _slow_query_lines
+    with _slow_query_lock:
+        _slow_query_path().unlink(missing_ok=True)
+        _slow_query_lines = 0
+
+def _read(kind: str, sql: str, params: Optional[list]):
+    with tracing.span(f"duckdb.{kind}", "sql", sql=_sql_label(sql)) as entry:
+        cursor = _manager.reader()
+        started = time.perf_counter()
+        result = getattr(cursor.execute(sql, params), kind)()
+        if kind == "fetchone":
+            # Drain the rest so the cursor's transaction ends; a pending result blocks CHECKPOINT on the writer.
+            cursor.fetchall()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        rows = int(result is not None) if kind == "fetchone" else len(result)
+        entry["rows"] = rows
+    if _slow_query_settings["enabled"] and elapsed_ms >= _slow_query_settings["threshold_ms"]:
+        _record_slow_query("read", sql, params, elapsed_ms, rows, _explain_analyze(cursor, sql.strip(), params))
+    return result
+
+def _fetchdf(sql: str, params: Optional[list] = None) -> pd.DataFrame:
+    return _read("fetchdf", sql, params)
+
+def _fetchall(sql: str, params: Optional[list] = None) -> list:
+    return _read("fetchall", sql, params)
+
+def _fetchone(sql: str, params: Optional[list] = None):
+    return _read("fetchone", sql, params)
 
-def get_connection():
-    DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-    return duckdb.connect(str(DB_PATH))
+ROLLUP_KEYS = {'market': 'market_id INTEGER', 'ledger': 'ledger_id INTEGER', 'bucket': 'bucket VARCHAR'}
+ROLLUP_DIMENSIONS = tuple(ROLLUP_KEYS)
 
+@tracing.traced("database")
 def init_database():
-    con = get_connection()
+    with _manager.writer() as con:
+        _create_schema(con)
+        _migrate_named_facts(con)
+        _migrate_named_archive(con)
+        _drop_superseded_archives(con)
+        _create_fact_view(con)
+        _migrate_archived_history(con)
+        _backfill_history(con)
+        rollups_missing = con.execute("""
+            SELECT (SELECT COUNT(*) FROM rollup_month) = 0
+               AND (SELECT COUNT(*) FROM snapshot_facts) > 0
+        """).fetchone()[0]
+    if rollups_missing:
+        rebuild_rollups()
+
+def _create_schema(con):
+    for dimension in ('market', 'ledger'):
+        con.execute(f"CREATE SEQUENCE IF NOT EXISTS dim_{dimension}_seq START 1")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS dim_{dimension} (
+                {dimension}_id INTEGER PRIMARY KEY DEFAULT nextval('dim_{dimension}_seq'),
+                {dimension} VARCHAR NOT NULL UNIQUE
+            )
+        """)
     con.execute("""
         CREATE TABLE IF NOT EXISTS financial_snapshots (
             month_tag VARCHAR NOT NULL,
-            market VARCHAR NOT NULL,
-            ledger VARCHAR NOT NULL,
+            market_id INTEGER NOT NULL,
+            ledger_id INTEGER NOT NULL,
             actual DOUBLE,
             plan DOUBLE,
             forecast DOUBLE,
             upload_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY(month_tag, market, ledger)
+            PRIMARY KEY(month_tag, market_id, ledger_id)
         )
     """)
     con.execute("""
@@ -41,21 +423,341 @@ def init_database():
             forecast_col VARCHAR
         )
     """)
-    con.close()
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_month (
+            month_tag VARCHAR NOT NULL,
+            actual DOUBLE,
+            plan DOUBLE,
+            forecast DOUBLE,
+            line_count BIGINT
+        )
+    """)
+    for dimension, key in ROLLUP_KEYS.items():
+        if dimension != 'bucket' and dimension in _table_columns(con, f"rollup_{dimension}"):
+            con.execute(f"DROP TABLE rollup_{dimension}")
+            con.execute("DELETE FROM rollup_month")
+        con.execute(f"""
+            CREATE TABLE IF NOT EXISTS rollup_{dimension} (
+                month_tag VARCHAR NOT NULL,
+                {key} NOT NULL,
+                actual DOUBLE,
+                plan DOUBLE,
+                forecast DOUBLE
+            )
+        """)
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope VARCHAR PRIMARY KEY,
+            version BIGINT NOT NULL
+        )
+    """)
+    # A random epoch per database file, so caches that outlive the process can tell a recreated database apart.
+    con.execute("""
+        INSERT INTO data_versions (scope, version)
+        SELECT 'epoch', CAST(random() * 9007199254740991 AS BIGINT)
+        ON CONFLICT (scope) DO NOTHING
+    """)
+    con.execute("CREATE SEQUENCE IF NOT EXISTS upload_log_seq START 1")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS upload_log (
+            upload_id INTEGER PRIMARY KEY DEFAULT nextval('upload_log_seq'),
+            month_tag VARCHAR NOT NULL,
+            fingerprint VARCHAR,
+            rows_read INTEGER,
+            rows_written INTEGER,
+            inserted INTEGER,
+            updated INTEGER,
+            deleted INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Append-only: every upload adds the rows it inserted, updated or deleted (as tombstones) under its upload_id.
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS snapshot_history (
+            month_tag VARCHAR NOT NULL,
+            market_id INTEGER NOT NULL,
+            ledger_id INTEGER NOT NULL,
+            revision INTEGER NOT NULL,
+            actual DOUBLE,
+            plan DOUBLE,
+            forecast DOUBLE,
+            deleted BOOLEAN NOT NULL DEFAULT FALSE
+        )
+    """)
+
+def _table_columns(con, table: str) -> list:
+    return [r[0] for r in con.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position", [table]
+    ).fetchall()]
+
+def _encode_dimensions(con, source: str):
+    for dimension in ('market', 'ledger'):
+        con.execute(f"""
+            INSERT INTO dim_{dimension} ({dimension})
+            SELECT DISTINCT s.{dimension} FROM {source} s
+            WHERE NOT EXISTS (SELECT 1 FROM dim_{dimension} d WHERE d.{dimension} = s.{dimension})
+            ORDER BY 1
+        """)
+
+def _migrate_named_facts(con):
+    if 'market' not in _table_columns(con, "financial_snapshots"):
+        return
+    con.execute("BEGIN TRANSACTION")
+    try:
+        _encode_dimensions(con, "financial_snapshots")
+        con.execute("ALTER TABLE financial_snapshots RENAME TO financial_snapshots_named")
+        _create_schema(con)
+        con.execute("""
+            INSERT INTO financial_snapshots (month_tag, market_id, ledger_id, actual, plan, forecast, upload_timestamp)
+            SELECT fs.month_tag, dm.market_id, dl.ledger_id, fs.actual, fs.plan, fs.forecast, fs.upload_timestamp
+            FROM financial_snapshots_named fs
+            JOIN dim_market dm ON dm.market = fs.market
+            JOIN dim_ledger dl ON dl.ledger = fs.ledger
+        """)
+        con.execute("DROP TABLE financial_snapshots_named")
+        con.execute("DELETE FROM rollup_month")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+def _migrate_named_archive(con):
+    for data_file in sorted(_archive_dir().glob("month_tag=*/*.parquet")):
+        path = data_file.as_posix().replace("'", "''")
+        columns = [r[0] for r in con.execute(f"DESCRIBE SELECT * FROM read_parquet('{path}')").fetchall()]
+        if 'market' not in columns:
+            continue
+        con.execute(f"CREATE OR REPLACE TEMP TABLE archive_named AS SELECT * FROM read_parquet('{path}')")
+        _encode_dimensions(con, "archive_named")
+        encoded = data_file.with_suffix(".encoded")
+        con.execute(f"""
+            COPY (
+                SELECT dm.market_id, dl.ledger_id, a.actual, a.plan, a.forecast, a.upload_timestamp
+                FROM archive_named a
+                JOIN dim_market dm ON dm.market = a.market
+                JOIN dim_ledger dl ON dl.ledger = a.ledger
+                ORDER BY dm.market_id, dl.ledger_id
+            ) TO '{encoded.as_posix()}' (FORMAT PARQUET)
+        """)
+        con.execute("DROP TABLE archive_named")
+        encoded.replace(data_file)
+
+def _backfill_history(con):
+    """Record months loaded before snapshot_history existed as one baseline revision each.
+
+    Archived months get their baseline written to the history archive
+    rather than the table.
+    """
+    recorded = [p.name.split("=", 1)[1] for p in _history_dir().glob("month_tag=*")]
+    archived_filter = f"AND month_tag NOT IN ({', '.join('?' * len(recorded))})" if recorded else ""
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.execute(f"""
+            CREATE OR REPLACE TEMP TABLE history_baseline AS
+            SELECT month_tag, nextval('upload_log_seq') AS revision, COUNT(*) AS line_count, MAX(upload_timestamp) AS uploaded_at
+            FROM snapshot_facts
+            WHERE month_tag NOT IN (SELECT DISTINCT month_tag FROM snapshot_history) {archived_filter}
+            GROUP BY month_tag
+        """, recorded)
+        con.execute("""
+            INSERT INTO upload_log (upload_id, month_tag, rows_read, rows_written, inserted, updated, deleted, uploaded_at)
+            SELECT revision, month_tag, line_count, line_count, line_count, 0, 0, COALESCE(uploaded_at, CURRENT_TIMESTAMP)
+            FROM history_baseline
+        """)
+        con.execute("""
+            INSERT INTO snapshot_history (month_tag, market_id, ledger_id, revision, actual, plan, forecast)
+            SELECT f.month_tag, f.market_id, f.ledger_id, b.revision, f.actual, f.plan, f.forecast
+            FROM financial_snapshots f
+            JOIN history_baseline b USING (month_tag)
+            ORDER BY f.month_tag, f.market_id, f.ledger_id
+        """)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    baselines = con.execute("SELECT month_tag, revision FROM history_baseline").fetchall()
+    con.execute("DROP TABLE history_baseline")
+    archived = set(get_archived_months())
+    for month_tag, revision in baselines:
+        if month_tag in archived:
+            data = _archive_dir() / f"month_tag={month_tag}" / "data.parquet"
+            _write_archived_history(con, month_tag, f"""
+                SELECT market_id, ledger_id, {int(revision)} AS revision, actual, plan, forecast, FALSE AS deleted
+                FROM read_parquet('{data.as_posix()}', hive_partitioning = false)
+            """)
+    if archived.intersection(month_tag for month_tag, _ in baselines):
+        _create_fact_view(con)
+
+def _migrate_archived_history(con):
+    """Move snapshot_history rows of months archived before archiving took their history along."""
+    archived = get_archived_months()
+    if not archived:
+        return
+    stale = con.execute(
+        f"SELECT DISTINCT month_tag FROM snapshot_history WHERE month_tag IN ({', '.join('?' * len(archived))})", archived
+    ).fetchall()
+    for (month_tag,) in stale:
+        _export_month_history(con, month_tag)
+        with _manager.transaction():
+            _create_fact_view(con)
+            con.execute("DELETE FROM snapshot_history WHERE month_tag = ?", [month_tag])
+
+def _archive_dir() -> Path:
+    return DB_PATH.parent / "archive"
+
+def _history_dir() -> Path:
+    return _archive_dir() / "history"
+
+def _archive_glob(archive: Path) -> Optional[str]:
+    if not any(archive.glob("month_tag=*/*.parquet")):
+        return None
+    return (archive / "month_tag=*" / "*.parquet").as_posix()
+
+def _archived_files(con) -> list:
+    """The archive's data files, minus partitions of months that are back in financial_snapshots.
+
+    A re-uploaded month is served from the hot table as soon as that
+    commits; its old partition is inert until it is cleaned up.
+    """
+    hot = {r[0] for r in con.execute("SELECT DISTINCT month_tag FROM financial_snapshots").fetchall()}
+    return [path.as_posix() for path in sorted(_archive_dir().glob("month_tag=*/*.parquet"))
+            if path.parent.name.split("=", 1)[1] not in hot]
+
+def _read_archive(files, columns: str) -> str:
+    """A UNION ALL branch over ``files``, a glob or a list of paths, read as hive-partitioned Parquet."""
+    paths = [files] if isinstance(files, str) else files
+    source = ", ".join("'" + path.replace("'", "''") + "'" for path in paths)
+    return f"""
+            UNION ALL
+            SELECT month_tag, {columns}
+            FROM read_parquet([{source}], hive_partitioning = true, hive_types = {{'month_tag': VARCHAR}})
+        """
+
+def _create_fact_view(con):
+    """(Re)create snapshot_facts and history_facts over the hot tables plus whatever is archived.
+
+    snapshot_facts names its archive files explicitly rather than by glob,
+    so a partition written ahead of the transaction that deletes the hot
+    rows only becomes visible together with that delete.
+    """
+    columns = "market_id, ledger_id, actual, plan, forecast, upload_timestamp"
+    hot = f"SELECT month_tag, {columns} FROM financial_snapshots"
+    archive = _archived_files(con)
+    if archive:
+        hot += _read_archive(archive, columns)
+    con.execute(f"CREATE OR REPLACE VIEW snapshot_facts AS {hot}")
+    columns = "market_id, ledger_id, revision, actual, plan, forecast, deleted"
+    history = f"SELECT month_tag, {columns} FROM snapshot_history"
+    archive = _archive_glob(_history_dir())
+    if archive:
+        history += _read_archive(archive, columns)
+    con.execute(f"CREATE OR REPLACE VIEW history_facts AS {history}")
+
+def _write_archived_history(con, month_tag: str, rows: str):
+    """Write ``rows`` (one month's history, without month_tag) as that month's archived history file."""
+    partition = _history_dir() / f"month_tag={month_tag}"
+    staging = _history_dir() / f".staging-{month_tag}"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    con.execute(f"""
+        COPY (SELECT * FROM ({rows}) ORDER BY revision, market_id, ledger_id)
+        TO '{(staging / "history.parquet").as_posix()}' (FORMAT PARQUET)
+    """)
+    shutil.rmtree(partition, ignore_errors=True)
+    staging.rename(partition)
 
+def _export_month_history(con, month_tag: str):
+    """Write the month's snapshot_history rows to its history archive, merged with revisions archived before."""
+    columns = "market_id, ledger_id, revision, actual, plan, forecast, deleted"
+    history = f"SELECT {columns} FROM snapshot_history WHERE month_tag = '{month_tag}'"
+    archived = _history_dir() / f"month_tag={month_tag}" / "history.parquet"
+    if not archived.exists() and not con.execute("SELECT COUNT(*) FROM snapshot_history WHERE month_tag = ?", [month_tag]).fetchone()[0]:
+        return
+    if archived.exists():
+        history += f" UNION ALL SELECT {columns} FROM read_parquet('{archived.as_posix()}', hive_partitioning = false)"
+    _write_archived_history(con, month_tag, history)
+
+def _bump_versions(con, *scopes: str):
+    for scope in scopes:
+        con.execute("""
+            INSERT INTO data_versions (scope, version) VALUES (?, 1)
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1
+        """, [scope])
+
+def _refresh_bucket_rollup(con, month_tag: Optional[str] = None, changed: Optional[str] = None):
+    buckets = f"""IN (
+            SELECT lm.bucket FROM {changed} c
+            JOIN dim_ledger dl ON dl.ledger_id = c.ledger_id
+            JOIN ledger_mapping lm ON dl.ledger = lm.ledger
+        )""" if changed else ""
+    if month_tag:
+        con.execute(f"DELETE FROM rollup_bucket WHERE month_tag = ? {'AND bucket ' + buckets if changed else ''}", [month_tag])
+    else:
+        con.execute("DELETE FROM rollup_bucket")
+    con.execute(f"""
+        INSERT INTO rollup_bucket (month_tag, bucket, actual, plan, forecast)
+        SELECT rl.month_tag, lm.bucket, SUM(rl.actual), SUM(rl.plan), SUM(rl.forecast)
+        FROM rollup_ledger rl
+        JOIN dim_ledger dl ON dl.ledger_id = rl.ledger_id
+        JOIN ledger_mapping lm ON dl.ledger = lm.ledger
+        WHERE lm.bucket IS NOT NULL {"AND rl.month_tag = ?" if month_tag else ""} {'AND lm.bucket ' + buckets if changed else ''}
+        GROUP BY rl.month_tag, lm.bucket
+    """, [month_tag] if month_tag else [])
+
+def _refresh_month_rollups(con, month_tag: str, source: str = "financial_snapshots", changed: Optional[str] = None):
+    """Recompute a month's rollups from ``source``.
+
+    With ``changed`` (a table of market_id, ledger_id pairs) only the market,
+    ledger and bucket rows those pairs touch are rebuilt; the month total
+    is always recomputed.
+    """
+    con.execute("DELETE FROM rollup_month WHERE month_tag = ?", [month_tag])
+    con.execute(f"""
+        INSERT INTO rollup_month (month_tag, actual, plan, forecast, line_count)
+        SELECT month_tag, SUM(actual), SUM(plan), SUM(forecast), COUNT(*)
+        FROM {source}
+        WHERE month_tag = ?
+        GROUP BY month_tag
+    """, [month_tag])
+    for key in ('market_id', 'ledger_id'):
+        dimension = key[:-3]
+        keys = f"AND {key} IN (SELECT {key} FROM {changed})" if changed else ""
+        con.execute(f"DELETE FROM rollup_{dimension} WHERE month_tag = ? {keys}", [month_tag])
+        con.execute(f"""
+            INSERT INTO rollup_{dimension} (month_tag, {key}, actual, plan, forecast)
+            SELECT month_tag, {key}, SUM(actual), SUM(plan), SUM(forecast)
+            FROM {source}
+            WHERE month_tag = ? {keys}
+            GROUP BY month_tag, {key}
+        """, [month_tag])
+    _refresh_bucket_rollup(con, month_tag, changed)
+
+@tracing.traced("database")
+def rebuild_rollups():
+    with _manager.transaction() as con:
+        months = [r[0] for r in con.execute("SELECT DISTINCT month_tag FROM snapshot_facts").fetchall()]
+        for table in ('month',) + ROLLUP_DIMENSIONS:
+            con.execute(f"DELETE FROM rollup_{table}")
+        for month_tag in months:
+            _refresh_month_rollups(con, month_tag, source="snapshot_facts")
+        _bump_versions(con, "snapshots", *(f"month:{m}" for m in months))
+
+@tracing.traced("database")
+def get_data_versions() -> dict:
+    return dict(_fetchall("SELECT scope, version FROM data_versions"))
+
+@tracing.traced("database")
 def save_column_mapping(market_col: str, ledger_col: str, actual_col: str, plan_col: str, forecast_col: str):
-    con = get_connection()
-    con.execute("DELETE FROM column_mapping")
-    con.execute("""
-        INSERT INTO column_mapping (id, market_col, ledger_col, actual_col, plan_col, forecast_col)
-        VALUES (1, ?, ?, ?, ?, ?)
-    """, [market_col, ledger_col, actual_col, plan_col, forecast_col])
-    con.close()
+    with _manager.transaction() as con:
+        con.execute("""
+            INSERT OR REPLACE INTO column_mapping (id, market_col, ledger_col, actual_col, plan_col, forecast_col)
+            VALUES (1, ?, ?, ?, ?, ?)
+        """, [market_col, ledger_col, actual_col, plan_col, forecast_col])
+        _bump_versions(con, "column_mapping")
 
+@tracing.traced("database")
 def get_column_mapping() -> Optional[dict]:
-    con = get_connection()
-    result = con.execute("SELECT * FROM column_mapping LIMIT 1").fetchone()
-    con.close()
+    result = _fetchone("SELECT * FROM column_mapping LIMIT 1")
     if result:
         return {
             "market_col": result[1],
@@ -66,73 +768,827 @@ def get_column_mapping() -> Optional[dict]:
         }
     return None
 
+@tracing.traced("database")
 def save_ledger_mapping(df: pd.DataFrame):
-    con = get_connection()
-    con.execute("DELETE FROM ledger_mapping")
-    for _, row in df.iterrows():
-        con.execute("""
-            INSERT INTO ledger_mapping (ledger, bucket, driver, controllable)
-            VALUES (?, ?, ?, ?)
-        """, [row['ledger'], row['bucket'], row['driver'], row['controllable']])
-    con.close()
+    frame = df[['ledger', 'bucket', 'driver', 'controllable']].drop_duplicates(subset=['ledger'], keep='last')
+    with _manager.writer() as con:
+        con.register("ledger_upload", frame)
+        try:
+            with _manager.transaction():
+                con.execute("""
+                    DELETE FROM ledger_mapping
+                    WHERE ledger NOT IN (SELECT CAST(ledger AS VARCHAR) FROM ledger_upload)
+                """)
+                con.execute("""
+                    INSERT OR REPLACE INTO ledger_mapping (ledger, bucket, driver, controllable)
+                    SELECT ledger, bucket, driver, controllable FROM ledger_upload
+                """)
+                _refresh_bucket_rollup(con)
+                _bump_versions(con, "ledger_mapping")
+        finally:
+            con.unregister("ledger_upload")
 
+@tracing.traced("database")
 def get_ledger_mapping() -> pd.DataFrame:
-    con = get_connection()
-    result = con.execute("SELECT * FROM ledger_mapping").fetchdf()
-    con.close()
-    return result
+    return _fetchdf("SELECT * FROM ledger_mapping")
 
-def save_financial_snapshot(df: pd.DataFrame, month_tag: str, mapping: dict):
-    con = get_connection()
-    try:
-        con.execute("DELETE FROM financial_snapshots WHERE month_tag = ?", [month_tag])
-        for _, row in df.iterrows():
-            con.execute("""
-                INSERT OR REPLACE INTO financial_snapshots (month_tag, market, ledger, actual, plan, forecast)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, [
-                month_tag,
-                str(row[mapping['market_col']]),
-                str(row[mapping['ledger_col']]),
-                float(row[mapping['actual_col']]) if pd.notna(row[mapping['actual_col']]) else 0,
-                float(row[mapping['plan_col']]) if pd.notna(row[mapping['plan_col']]) else 0,
-                float(row[mapping['forecast_col']]) if pd.notna(row[mapping['forecast_col']]) else 0
-            ])
-    except Exception:
-        pass
-    finally:
-        con.close()
+def _normalize_snapshot_frame(df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    frame = pd.DataFrame({
+        "market": df[mapping['market_col']].astype(str),
+        "ledger": df[mapping['ledger_col']].astype(str),
+        "actual": pd.to_numeric(df[mapping['actual_col']], errors="coerce"),
+        "plan": pd.to_numeric(df[mapping['plan_col']], errors="coerce"),
+        "forecast": pd.to_numeric(df[mapping['forecast_col']], errors="coerce"),
+    })
+    frame[["actual", "plan", "forecast"]] = frame[["actual", "plan", "forecast"]].fillna(0).astype("float64")
+    return frame
+
+NATIVE_READERS = {'.csv': 'read_csv_auto', '.parquet': 'read_parquet'}
+
+def _quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _native_reader(path) -> str:
+    suffix = Path(path).suffix.lower()
+    if suffix not in NATIVE_READERS:
+        raise ValueError(f"Unsupported file type {suffix!r}; expected one of {', '.join(NATIVE_READERS)}")
+    return NATIVE_READERS[suffix]
+
+def _stage_snapshot_chunks(con, chunks: Iterable[pd.DataFrame], mapping: dict,
+                           progress: Optional[Callable[[int], None]] = None) -> int:
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE snapshot_staging (
+            market VARCHAR,
+            ledger VARCHAR,
+            actual DOUBLE,
+            plan DOUBLE,
+            forecast DOUBLE
+        )
+    """)
+    rows_read = 0
+    for chunk in chunks:
+        frame = _normalize_snapshot_frame(chunk, mapping)
+        con.register("snapshot_chunk", frame)
+        try:
+            con.execute("INSERT INTO snapshot_staging SELECT market, ledger, actual, plan, forecast FROM snapshot_chunk")
+        finally:
+            con.unregister("snapshot_chunk")
+        rows_read += len(frame)
+        if progress:
+            progress(rows_read)
+    return rows_read
+
+def _stage_native_file(con, path, mapping: dict) -> int:
+    reader = _native_reader(path)
+    market, ledger, actual, plan, forecast = (
+        _quote_identifier(mapping[field])
+        for field in ('market_col', 'ledger_col', 'actual_col', 'plan_col', 'forecast_col')
+    )
+    con.execute(f"""
+        CREATE OR REPLACE TEMP TABLE snapshot_staging AS
+        SELECT CAST({market} AS VARCHAR) AS market,
+               CAST({ledger} AS VARCHAR) AS ledger,
+               COALESCE(TRY_CAST({actual} AS DOUBLE), 0) AS actual,
+               COALESCE(TRY_CAST({plan} AS DOUBLE), 0) AS plan,
+               COALESCE(TRY_CAST({forecast} AS DOUBLE), 0) AS forecast
+        FROM {reader}(?)
+        WHERE {market} IS NOT NULL AND {ledger} IS NOT NULL
+    """, [str(path)])
+    return con.execute("SELECT COUNT(*) FROM snapshot_staging").fetchone()[0]
+
+def _publish_staged_snapshot(con, month_tag: str, fingerprint: Optional[str] = None) -> dict:
+    """Diff the staged upload against the stored month and write only the inserted, updated and deleted rows.
+
+    The changed rows are also appended to snapshot_history as a new
+    revision (the upload_log id), so earlier versions stay queryable.
+    """
+    revision = con.execute("SELECT nextval('upload_log_seq')").fetchone()[0]
+    archived = _is_archived(con, month_tag)
+    _encode_dimensions(con, "snapshot_staging")
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE snapshot_upload AS
+        SELECT dm.market_id, dl.ledger_id, s.actual, s.plan, s.forecast
+        FROM snapshot_staging s
+        JOIN dim_market dm ON dm.market = s.market
+        JOIN dim_ledger dl ON dl.ledger = s.ledger
+        QUALIFY row_number() OVER (PARTITION BY dm.market_id, dl.ledger_id ORDER BY s.rowid DESC) = 1
+    """)
+    con.execute("""
+        CREATE OR REPLACE TEMP TABLE snapshot_changes AS
+        SELECT COALESCE(su.market_id, fs.market_id) AS market_id,
+               COALESCE(su.ledger_id, fs.ledger_id) AS ledger_id,
+               CASE WHEN fs.market_id IS NULL THEN 'insert'
+                    WHEN su.market_id IS NULL THEN 'delete'
+                    ELSE 'update' END AS change,
+               su.actual, su.plan, su.forecast
+        FROM snapshot_upload su
+        FULL OUTER JOIN (
+            SELECT market_id, ledger_id, actual, plan, forecast FROM snapshot_facts WHERE month_tag = ?
+        ) fs ON fs.market_id = su.market_id AND fs.ledger_id = su.ledger_id
+        WHERE fs.market_id IS NULL
+           OR su.market_id IS NULL
+           OR (su.actual, su.plan, su.forecast) IS DISTINCT FROM (fs.actual, fs.plan, fs.forecast)
+    """, [month_tag])
+    counts = dict(con.execute("SELECT change, COUNT(*) FROM snapshot_changes GROUP BY change").fetchall())
+    staged, uploaded = con.execute("SELECT (SELECT COUNT(*) FROM snapshot_staging), (SELECT COUNT(*) FROM snapshot_upload)").fetchone()
+    summary = {
+        "rows_written": counts.get('insert', 0) + counts.get('update', 0),
+        "inserted": counts.get('insert', 0),
+        "updated": counts.get('update', 0),
+        "deleted": counts.get('delete', 0)
+    }
+    summary["unchanged"] = uploaded - summary["rows_written"]
+    summary["duplicates_dropped"] = staged - uploaded
+    summary["revision"] = revision
+    if counts and archived:
+        # The stored rows live in the Parquet archive, so the whole upload moves back into the hot table.
+        con.execute("""
+            INSERT INTO financial_snapshots (month_tag, market_id, ledger_id, actual, plan, forecast, upload_timestamp)
+            SELECT ?, market_id, ledger_id, actual, plan, forecast, CURRENT_TIMESTAMP
+            FROM snapshot_upload
+        """, [month_tag])
+        # Drops the partition from snapshot_facts in this same transaction; the files go at the next init.
+        _create_fact_view(con)
+    elif counts:
+        # Keys are only ever deleted or inserted, never both, which DuckDB's PK index cannot take in one transaction.
+        con.execute("""
+            DELETE FROM financial_snapshots fs USING snapshot_changes c
+            WHERE fs.month_tag = ? AND c.change = 'delete'
+              AND fs.market_id = c.market_id AND fs.ledger_id = c.ledger_id
+        """, [month_tag])
+        con.execute("""
+            UPDATE financial_snapshots fs
+            SET actual = c.actual, plan = c.plan, forecast = c.forecast, upload_timestamp = CURRENT_TIMESTAMP
+            FROM snapshot_changes c
+            WHERE fs.month_tag = ? AND c.change = 'update'
+              AND fs.market_id = c.market_id AND fs.ledger_id = c.ledger_id
+        """, [month_tag])
+        con.execute("""
+            INSERT INTO financial_snapshots (month_tag, market_id, ledger_id, actual, plan, forecast, upload_timestamp)
+            SELECT ?, market_id, ledger_id, actual, plan, forecast, CURRENT_TIMESTAMP
+            FROM snapshot_changes WHERE change = 'insert'
+        """, [month_tag])
+    if counts:
+        con.execute("""
+            INSERT INTO snapshot_history (month_tag, market_id, ledger_id, revision, actual, plan, forecast, deleted)
+            SELECT ?, market_id, ledger_id, ?, actual, plan, forecast, change = 'delete'
+            FROM snapshot_changes
+            ORDER BY market_id, ledger_id
+        """, [month_tag, revision])
+        # An archived month's rollups were built from the archive, so they are rebuilt in full.
+        _refresh_month_rollups(con, month_tag, changed=None if archived else "snapshot_changes")
+        _bump_versions(con, f"month:{month_tag}", "snapshots")
+    con.execute("""
+        INSERT INTO upload_log (upload_id, month_tag, fingerprint, rows_read, rows_written, inserted, updated, deleted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, [revision, month_tag, fingerprint, staged, summary["rows_written"], summary["inserted"], summary["updated"], summary["deleted"]])
+    return summary
+
+def _mapped_columns(mapping: dict) -> bytes:
+    return json.dumps({key: mapping[key] for key in sorted(mapping) if key.endswith('_col')}).encode("utf-8")
+
+def file_fingerprint(path, mapping: dict) -> str:
+    """SHA-256 of the file bytes plus the column mapping it will be read with."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(_mapped_columns(mapping))
+    return digest.hexdigest()
+
+def frame_fingerprint(df: pd.DataFrame, mapping: dict) -> str:
+    """SHA-256 of a DataFrame's column names and per-row hashes plus the column mapping."""
+    digest = hashlib.sha256(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(_mapped_columns(mapping))
+    return digest.hexdigest()
+
+_LAST_UPLOAD_SQL = """
+    SELECT u.fingerprint, r.line_count
+    FROM upload_log u
+    LEFT JOIN rollup_month r USING (month_tag)
+    WHERE u.month_tag = ?
+    ORDER BY u.upload_id DESC
+    LIMIT 1
+"""
+
+def _skipped_report(month_tag: str, fingerprint: str, rows: int, started: float) -> dict:
+    return {
+        "month_tag": month_tag,
+        "rows_read": 0,
+        "rows_written": 0,
+        "duplicates_dropped": 0,
+        "inserted": 0,
+        "updated": 0,
+        "deleted": 0,
+        "unchanged": rows or 0,
+        "skipped": True,
+        "revision": None,
+        "fingerprint": fingerprint,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+@tracing.traced("database")
+def unchanged_upload_report(month_tag: str, fingerprint: str) -> Optional[dict]:
+    """The report of a skipped save if ``fingerprint`` matches the month's last upload, else None.
+
+    Lets callers skip parsing a workbook that is byte-for-byte the one already loaded.
+    """
+    started = time.perf_counter()
+    last = _fetchone(_LAST_UPLOAD_SQL, [month_tag])
+    if last is None or last[0] != fingerprint:
+        return None
+    return _skipped_report(month_tag, fingerprint, last[1], started)
+
+def _ingest_staged(stage: Callable, month_tag: str, fingerprint: Optional[str] = None,
+                   publish_guard: Optional[Callable[[], ContextManager]] = None) -> dict:
+    check_month_tag(month_tag)
+    started = time.perf_counter()
+    with _manager.writer() as con:
+        last = con.execute(_LAST_UPLOAD_SQL, [month_tag]).fetchone() if fingerprint else None
+        if last is not None and last[0] == fingerprint:
+            return _skipped_report(month_tag, fingerprint, last[1], started)
+        try:
+            rows_read = stage(con)
+            with (publish_guard or nullcontext)():
+                with _manager.transaction():
+                    summary = _publish_staged_snapshot(con, month_tag, fingerprint)
+                if summary["deleted"] and _is_archived(con, month_tag):
+                    # An empty upload of an archived month: no hot rows hide the old partition, so drop it.
+                    shutil.rmtree(_archive_dir() / f"month_tag={month_tag}")
+                    with _manager.transaction():
+                        _create_fact_view(con)
+                        _bump_versions(con, f"month:{month_tag}", "snapshots")
+        finally:
+            con.execute("DROP TABLE IF EXISTS snapshot_staging")
+            con.execute("DROP TABLE IF EXISTS snapshot_upload")
+            con.execute("DROP TABLE IF EXISTS snapshot_changes")
+    return {
+        "month_tag": month_tag,
+        "rows_read": rows_read,
+        **summary,
+        "skipped": False,
+        "fingerprint": fingerprint,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+@tracing.traced("database")
+def save_financial_snapshot_chunks(chunks: Iterable[pd.DataFrame], month_tag: str, mapping: dict,
+                                   progress: Optional[Callable[[int], None]] = None,
+                                   fingerprint: Optional[str] = None,
+                                   publish_guard: Optional[Callable[[], ContextManager]] = None) -> dict:
+    """Stage ``chunks`` and apply them to the month as a diff.
+
+    The report counts inserted / updated / deleted / unchanged rows, with
+    rows_written = inserted + updated and rows_read as staged. When
+    ``fingerprint`` equals the month's last upload nothing is read or
+    written and the report has ``skipped=True``. ``publish_guard``, if
+    given, is entered around the publish step (see jobs.committing).
+    """
+    return _ingest_staged(lambda con: _stage_snapshot_chunks(con, chunks, mapping, progress), month_tag, fingerprint,
+                          publish_guard)
+
+@tracing.traced("database")
+def save_financial_snapshot(df: pd.DataFrame, month_tag: str, mapping: dict, fingerprint: Optional[str] = None) -> dict:
+    return save_financial_snapshot_chunks([df], month_tag, mapping, fingerprint=fingerprint or frame_fingerprint(df, mapping))
+
+@tracing.traced("database")
+def ingest_file(path, month_tag: str, mapping: dict,
+                publish_guard: Optional[Callable[[], ContextManager]] = None) -> dict:
+    """Load a CSV or Parquet file with DuckDB's native readers, projecting the mapped columns in SQL."""
+    check_month_tag(month_tag)
+    fingerprint = file_fingerprint(path, mapping)
+    return _ingest_staged(lambda con: _stage_native_file(con, path, mapping), month_tag, fingerprint, publish_guard)
 
+@tracing.traced("database")
+def preview_native_file(path, n_rows: int = 10) -> pd.DataFrame:
+    return _fetchdf(f"SELECT * FROM {_native_reader(path)}(?) LIMIT ?", [str(path), n_rows])
+
+@tracing.traced("database")
+def native_row_count(path) -> Optional[int]:
+    if _native_reader(path) != 'read_parquet':
+        return None
+    return _fetchone("SELECT COUNT(*) FROM read_parquet(?)", [str(path)])[0]
+
+MONTH_TAG_FORMAT = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+def check_month_tag(month_tag: str) -> str:
+    """Return ``month_tag`` if it is a YYYY-MM month; trend windows and archive partitions rely on that shape."""
+    if not isinstance(month_tag, str) or not MONTH_TAG_FORMAT.match(month_tag):
+        raise ValueError(f"Invalid month tag {month_tag!r}: expected YYYY-MM")
+    return month_tag
+
+def _is_archived(con, month_tag: str) -> bool:
+    partition = _archive_dir() / f"month_tag={month_tag}"
+    if not any(partition.glob("*.parquet")):
+        return False
+    return not con.execute("SELECT COUNT(*) FROM financial_snapshots WHERE month_tag = ?", [month_tag]).fetchone()[0]
+
+def _drop_superseded_archives(con):
+    """Delete partitions of months that were re-uploaded; snapshot_facts already ignores them."""
+    hot = {r[0] for r in con.execute("SELECT DISTINCT month_tag FROM financial_snapshots").fetchall()}
+    for partition in _archive_dir().glob("month_tag=*"):
+        if partition.name.split("=", 1)[1] in hot:
+            shutil.rmtree(partition)
+
+@tracing.traced("database")
+def get_archived_months() -> list:
+    archive = _archive_dir()
+    if not archive.exists():
+        return []
+    hot = set(get_hot_months())
+    months = [p.name.split("=", 1)[1] for p in archive.glob("month_tag=*") if any(p.glob("*.parquet"))]
+    return sorted((month for month in months if month not in hot), reverse=True)
+
+@tracing.traced("database")
+def get_hot_months() -> list:
+    result = _fetchall("SELECT DISTINCT month_tag FROM financial_snapshots ORDER BY month_tag DESC")
+    return [r[0] for r in result]
+
+@tracing.traced("database")
+def archive_months(months: list, progress: Optional[Callable[[int], None]] = None,
+                   publish_guard: Optional[Callable[[], ContextManager]] = None) -> dict:
+    """Move closed months from the hot table into the month-partitioned Parquet archive.
+
+    Each month is moved atomically, inside ``publish_guard`` if given,
+    and takes its snapshot_history rows along to the history archive;
+    ``progress`` receives the number of months handled so far.
+    """
+    started = time.perf_counter()
+    months = sorted(set(months))
+    for month_tag in months:
+        check_month_tag(month_tag)
+    archive = _archive_dir()
+    archive.mkdir(parents=True, exist_ok=True)
+    rows_archived = 0
+    with _manager.writer() as con:
+        for done, month_tag in enumerate(months, start=1):
+            partition = archive / f"month_tag={month_tag}"
+            staging = archive / f".staging-{month_tag}"
+            shutil.rmtree(staging, ignore_errors=True)
+            rows = con.execute("SELECT COUNT(*) FROM financial_snapshots WHERE month_tag = ?", [month_tag]).fetchone()[0]
+            if rows == 0:
+                continue
+            with (publish_guard or nullcontext)():
+                staging.mkdir()
+                con.execute(f"""
+                    COPY (
+                        SELECT market_id, ledger_id, actual, plan, forecast, upload_timestamp
+                        FROM financial_snapshots
+                        WHERE month_tag = '{month_tag}'
+                        ORDER BY market_id, ledger_id
+                    ) TO '{(staging / "data.parquet").as_posix()}' (FORMAT PARQUET)
+                """)
+                shutil.rmtree(partition, ignore_errors=True)
+                staging.rename(partition)
+                _export_month_history(con, month_tag)
+                with _manager.transaction():
+                    # The new partition joins snapshot_facts in the same commit that removes the hot rows.
+                    con.execute("DELETE FROM financial_snapshots WHERE month_tag = ?", [month_tag])
+                    con.execute("DELETE FROM snapshot_history WHERE month_tag = ?", [month_tag])
+                    _create_fact_view(con)
+                    _bump_versions(con, f"month:{month_tag}", "snapshots")
+            rows_archived += rows
+            if progress:
+                progress(done)
+        try:
+            con.execute("CHECKPOINT")
+        except duckdb.TransactionException:
+            # Readers mid-query block a manual checkpoint; DuckDB's automatic one reclaims the space later.
+            pass
+    return {
+        "months": months,
+        "rows_archived": rows_archived,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+@tracing.traced("database")
+def archive_closed_months(keep_recent: int = 12) -> dict:
+    hot_months = get_hot_months()
+    return archive_months(hot_months[keep_recent:])
+
+def _with_dimension_names(frame: pd.DataFrame) -> pd.DataFrame:
+    """Replace market_id/ledger_id columns with categorical name columns decoded from the dimension tables."""
+    for dimension in ('market', 'ledger'):
+        key = f"{dimension}_id"
+        if key not in frame.columns:
+            continue
+        names = dict(_fetchall(f"SELECT {key}, {dimension} FROM dim_{dimension}"))
+        categories = [names.get(i, f"<unused {dimension} id {i}>") for i in range(max(names, default=0) + 1)]
+        frame[key] = pd.Categorical.from_codes(frame[key].to_numpy(), categories=categories).remove_unused_categories()
+        frame = frame.rename(columns={key: dimension})
+    return frame
+
+def _as_of_literal(as_of) -> str:
+    stamp = pd.Timestamp(as_of)
+    if stamp.tzinfo is not None:
+        stamp = stamp.tz_convert(None)
+    return f"TIMESTAMP '{stamp.isoformat(sep=' ')}'"
+
+def _facts(as_of=None) -> str:
+    """snapshot_facts, or the rows as they stood at ``as_of`` rebuilt from history_facts.
+
+    Revisions are numbered in upload order, so the state at ``as_of`` is
+    each line's latest history row up to the last revision uploaded by
+    then, minus tombstones.
+    """
+    if as_of is None:
+        return "snapshot_facts"
+    return f"""(
+        SELECT h.month_tag, h.market_id, h.ledger_id, h.actual, h.plan, h.forecast, u.uploaded_at AS upload_timestamp
+        FROM (
+            SELECT * FROM history_facts
+            WHERE revision <= (SELECT MAX(upload_id) FROM upload_log WHERE uploaded_at <= {_as_of_literal(as_of)})
+            QUALIFY row_number() OVER (PARTITION BY month_tag, market_id, ledger_id ORDER BY revision DESC) = 1
+        ) h
+        JOIN upload_log u ON u.upload_id = h.revision
+        WHERE NOT h.deleted
+    )"""
+
+def _rollup(table: str, as_of=None) -> str:
+    """rollup_<table>, or the same rows aggregated from the facts as of ``as_of``."""
+    if as_of is None:
+        return f"rollup_{table}"
+    facts = _facts(as_of)
+    if table == 'month':
+        return f"""(
+            SELECT month_tag, SUM(actual) AS actual, SUM(plan) AS plan, SUM(forecast) AS forecast, COUNT(*) AS line_count
+            FROM {facts} f
+            GROUP BY month_tag
+        )"""
+    if table == 'bucket':
+        return f"""(
+            SELECT f.month_tag, lm.bucket, SUM(f.actual) AS actual, SUM(f.plan) AS plan, SUM(f.forecast) AS forecast
+            FROM {facts} f
+            JOIN dim_ledger dl ON dl.ledger_id = f.ledger_id
+            JOIN ledger_mapping lm ON dl.ledger = lm.ledger
+            WHERE lm.bucket IS NOT NULL
+            GROUP BY f.month_tag, lm.bucket
+        )"""
+    return f"""(
+        SELECT month_tag, {table}_id, SUM(actual) AS actual, SUM(plan) AS plan, SUM(forecast) AS forecast
+        FROM {facts} f
+        GROUP BY month_tag, {table}_id
+    )"""
+
+def _snapshot_query(where: str = "", order_by: str = "", as_of=None) -> str:
+    return f"""
+        SELECT fs.month_tag, fs.market_id, fs.ledger_id, fs.actual, fs.plan, fs.forecast, fs.upload_timestamp,
+               lm.bucket, lm.driver, lm.controllable
+        FROM {_facts(as_of)} fs
+        LEFT JOIN dim_ledger dl ON dl.ledger_id = fs.ledger_id
+        LEFT JOIN ledger_mapping lm ON lm.ledger = dl.ledger
+        {where}
+        {order_by}
+    """
+
+@tracing.traced("database")
 def get_all_snapshots() -> pd.DataFrame:
-    con = get_connection()
-    result = con.execute("""
-        SELECT fs.*, lm.bucket, lm.driver, lm.controllable
-        FROM financial_snapshots fs
-        LEFT JOIN ledger_mapping lm ON fs.ledger = lm.ledger
-        ORDER BY month_tag DESC
-    """).fetchdf()
-    con.close()
-    return result
+    return _with_dimension_names(_fetchdf(_snapshot_query(order_by="ORDER BY fs.month_tag DESC")))
 
+@tracing.traced("database")
 def get_available_months() -> list:
-    con = get_connection()
-    result = con.execute("SELECT DISTINCT month_tag FROM financial_snapshots ORDER BY month_tag DESC").fetchall()
-    con.close()
+    result = _fetchall("SELECT month_tag FROM rollup_month ORDER BY month_tag DESC")
     return [r[0] for r in result]
 
-def get_snapshot_by_month(month_tag: str) -> pd.DataFrame:
-    con = get_connection()
-    result = con.execute("""
-        SELECT fs.*, lm.bucket, lm.driver, lm.controllable
-        FROM financial_snapshots fs
-        LEFT JOIN ledger_mapping lm ON fs.ledger = lm.ledger
-        WHERE month_tag = ?
-    """, [month_tag]).fetchdf()
-    con.close()
-    return result
+@tracing.traced("database")
+def get_snapshot_by_month(month_tag: str, as_of=None) -> pd.DataFrame:
+    """The month's lines; with ``as_of`` (a timestamp) as they stood after the last upload at or before it."""
+    return _with_dimension_names(_fetchdf(_snapshot_query(where="WHERE fs.month_tag = ?", as_of=as_of), [month_tag]))
 
+@tracing.traced("database")
+def get_snapshot_revisions(months: Optional[tuple] = None) -> pd.DataFrame:
+    """Uploads that changed data, newest first, with the delta rows each one stored."""
+    month_filter = f"AND month_tag IN ({', '.join('?' * len(months))})" if months else ""
+    return _fetchdf(f"""
+        SELECT upload_id AS revision, month_tag, uploaded_at, inserted, updated, deleted,
+               inserted + updated + deleted AS delta_rows
+        FROM upload_log
+        WHERE inserted + updated + deleted > 0 {month_filter}
+        ORDER BY upload_id DESC
+    """, list(months or []))
+
+@tracing.traced("database")
 def get_markets() -> list:
-    con = get_connection()
-    result = con.execute("SELECT DISTINCT market FROM financial_snapshots ORDER BY market").fetchall()
-    con.close()
+    result = _fetchall("""
+        SELECT DISTINCT dm.market
+        FROM rollup_market rm
+        JOIN dim_market dm ON dm.market_id = rm.market_id
+        ORDER BY dm.market
+    """)
     return [r[0] for r in result]
+
+def _market_id(market: str) -> int:
+    result = _fetchone("SELECT market_id FROM dim_market WHERE market = ?", [market])
+    return result[0] if result else -1
+
+METRICS = ('actual', 'plan', 'forecast')
+SUMMARY_DIMENSIONS = ('market', 'bucket', 'ledger')
+
+def _check_choice(value: str, allowed: tuple, name: str) -> str:
+    if value not in allowed:
+        raise ValueError(f"{name} must be one of {allowed}, got {value!r}")
+    return value
+
+@tracing.traced("database")
+def month_summary(month_tag: str, by: str = 'market', as_of=None) -> pd.DataFrame:
+    by = _check_choice(by, SUMMARY_DIMENSIONS, "by")
+    if by == 'bucket':
+        return _fetchdf(f"""
+            SELECT bucket, actual, plan, forecast
+            FROM {_rollup('bucket', as_of)} r
+            WHERE month_tag = ?
+            ORDER BY bucket
+        """, [month_tag])
+    return _fetchdf(f"""
+        SELECT d.{by}, r.actual, r.plan, r.forecast
+        FROM {_rollup(by, as_of)} r
+        JOIN dim_{by} d ON d.{by}_id = r.{by}_id
+        WHERE r.month_tag = ?
+        ORDER BY d.{by}
+    """, [month_tag])
+
+@tracing.traced("database")
+def totals_by_month(as_of=None) -> pd.DataFrame:
+    return _fetchdf(f"""
+        SELECT month_tag, actual, plan, forecast
+        FROM {_rollup('month', as_of)} r
+        ORDER BY month_tag
+    """)
+
+def _decode_columns(keys: list, alias: str = "r") -> tuple:
+    names = ", ".join(f"d_{k}.{k}" for k in keys)
+    joins = " ".join(f"JOIN dim_{k} d_{k} ON d_{k}.{k}_id = {alias}.{k}_id" for k in keys)
+    return names, joins
+
+@tracing.traced("database")
+def mom_delta(current_month: str, previous_month: str, market: Optional[str] = None, by: str = 'ledger',
+              as_of=None) -> pd.DataFrame:
+    keys = ['market', 'ledger'] if by == 'line' else [_check_choice(by, ('market', 'ledger', 'line'), "by")]
+    id_cols = ", ".join(f"{k}_id" for k in keys)
+    join_cond = " AND ".join(f"c.{k}_id = p.{k}_id" for k in keys)
+    market_filter = "AND market_id = ?" if market else ""
+    source = _rollup(by, as_of) if by != 'line' and not market else _facts(as_of)
+    month_cte = f"""
+        SELECT {id_cols}, SUM(actual) AS actual
+        FROM {source} s
+        WHERE month_tag = ? {market_filter}
+        GROUP BY {id_cols}
+    """
+    market_param = [_market_id(market)] if market else []
+    names, joins = _decode_columns(keys)
+    return _fetchdf(f"""
+        WITH c AS ({month_cte}), p AS ({month_cte}),
+        r AS (
+            SELECT {", ".join(f"c.{k}_id" for k in keys)},
+                   c.actual AS actual_current,
+                   p.actual AS actual_previous,
+                   c.actual - p.actual AS change,
+                   ROUND((c.actual - p.actual) / ABS(p.actual) * 100, 1) AS pct_change
+            FROM c JOIN p ON {join_cond}
+        )
+        SELECT {names}, r.actual_current, r.actual_previous, r.change, r.pct_change
+        FROM r {joins}
+        ORDER BY r.change
+    """, [current_month] + market_param + [previous_month] + market_param)
+
+@tracing.traced("database")
+def variance_pareto(month_tag: str, basis: str = 'plan', top_n: int = 20, as_of=None) -> pd.DataFrame:
+    """Top ``top_n`` lines by |actual - basis| with their exact cumulative share of the month's total |variance|.
+
+    The grand total comes from one aggregate and the ranking from an
+    ORDER BY ... LIMIT (DuckDB's heap-based Top-N), so no full sort or
+    full-table running sum is needed; the cumulative sum only runs over
+    the selected prefix, which is all it depends on.
+    """
+    basis = _check_choice(basis, ('plan', 'forecast'), "basis")
+    names, joins = _decode_columns(['market', 'ledger'])
+    return _fetchdf(f"""
+        WITH v AS MATERIALIZED (
+            SELECT market_id, ledger_id, actual - {basis} AS variance
+            FROM {_facts(as_of)} f
+            WHERE month_tag = ?
+        ),
+        total AS (
+            SELECT SUM(ABS(variance)) AS total_abs FROM v
+        ),
+        top AS (
+            SELECT market_id, ledger_id, variance, ABS(variance) AS abs_variance
+            FROM v
+            ORDER BY abs_variance DESC, market_id, ledger_id
+            LIMIT ?
+        ),
+        r AS (
+            SELECT top.*,
+                   SUM(abs_variance) OVER (ORDER BY abs_variance DESC, market_id, ledger_id
+                                           ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+                       / total.total_abs * 100 AS cumulative_pct
+            FROM top, total
+        )
+        SELECT {names}, r.variance, r.abs_variance, r.cumulative_pct
+        FROM r {joins}
+        ORDER BY r.abs_variance DESC, r.market_id, r.ledger_id
+    """, [month_tag, top_n])
+
+@tracing.traced("database")
+def top_movers(current_month: str, previous_month: str, top_n: int = 10, as_of=None) -> pd.DataFrame:
+    """The ``top_n`` largest gains and declines of market x ledger lines between two months.
+
+    Deltas are computed once on integer keys; each side is a Top-N over
+    that result, and names are decoded only for the 2 x top_n survivors.
+    Rows carry ``side`` ('gainer' / 'decliner'), each side ordered by
+    magnitude; a line can appear on both sides when there are few lines.
+    """
+    names, joins = _decode_columns(['market', 'ledger'])
+    month_cte = f"""
+        SELECT market_id, ledger_id, SUM(actual) AS actual
+        FROM {_facts(as_of)} f
+        WHERE month_tag = ?
+        GROUP BY market_id, ledger_id
+    """
+    return _fetchdf(f"""
+        WITH c AS ({month_cte}), p AS ({month_cte}),
+        d AS MATERIALIZED (
+            SELECT c.market_id, c.ledger_id, c.actual - p.actual AS change
+            FROM c JOIN p ON c.market_id = p.market_id AND c.ledger_id = p.ledger_id
+        ),
+        r AS (
+            SELECT *, 'gainer' AS side, row_number() OVER (ORDER BY change DESC, market_id, ledger_id) AS side_rank
+            FROM (SELECT * FROM d ORDER BY change DESC, market_id, ledger_id LIMIT ?)
+            UNION ALL
+            SELECT *, 'decliner' AS side, row_number() OVER (ORDER BY change ASC, market_id, ledger_id) AS side_rank
+            FROM (SELECT * FROM d ORDER BY change ASC, market_id, ledger_id LIMIT ?)
+        )
+        SELECT {names}, r.change, r.side
+        FROM r {joins}
+        ORDER BY r.side DESC, r.side_rank
+    """, [current_month, previous_month, top_n, top_n])
+
+@tracing.traced("database")
+def metric_trend(market: Optional[str] = None, metric: str = 'actual', top_ledgers: int = 8, as_of=None) -> pd.DataFrame:
+    metric = _check_choice(metric, METRICS, "metric")
+    if market:
+        bucket_source = f"""(
+            SELECT fs.month_tag, lm.bucket, fs.{metric}
+            FROM {_facts(as_of)} fs
+            JOIN dim_ledger dl ON dl.ledger_id = fs.ledger_id
+            JOIN ledger_mapping lm ON lm.ledger = dl.ledger
+            WHERE fs.market_id = ? AND lm.bucket IS NOT NULL
+        )"""
+        ledger_source = f"(SELECT month_tag, ledger_id, {metric} FROM {_facts(as_of)} f WHERE market_id = ?)"
+        params = [_market_id(market)]
+    else:
+        bucket_source, ledger_source, params = _rollup('bucket', as_of), _rollup('ledger', as_of), []
+    has_buckets = _fetchone(f"SELECT COUNT(*) FROM {bucket_source} b", params)[0] > 0
+    if has_buckets:
+        return _fetchdf(f"""
+            SELECT month_tag, bucket, SUM({metric}) AS {metric}
+            FROM {bucket_source} b
+            GROUP BY month_tag, bucket
+            ORDER BY month_tag, bucket
+        """, params)
+    return _fetchdf(f"""
+        WITH t AS (
+            SELECT month_tag, ledger_id, SUM({metric}) AS {metric}
+            FROM {ledger_source} l
+            GROUP BY month_tag, ledger_id
+        ),
+        top AS (
+            SELECT ledger_id FROM t GROUP BY ledger_id ORDER BY SUM({metric}) DESC LIMIT ?
+        )
+        SELECT t.month_tag, dl.ledger, t.{metric}
+        FROM t
+        JOIN top USING (ledger_id)
+        JOIN dim_ledger dl ON dl.ledger_id = t.ledger_id
+        ORDER BY t.month_tag, dl.ledger
+    """, params + [top_ledgers])
+
+@tracing.traced("database")
+def variance_exceptions(month_tag: str, threshold_pct: float = 5.0, limit: int = 20, basis: str = 'plan',
+                        as_of=None) -> pd.DataFrame:
+    """Lines whose variance against ``basis`` exceeds ``threshold_pct``, most unfavorable first, capped at ``limit``."""
+    basis = _check_choice(basis, ('plan', 'forecast'), "basis")
+    names, joins = _decode_columns(['market', 'ledger'])
+    return _fetchdf(f"""
+        WITH v AS (
+            SELECT market_id, ledger_id, actual, {basis},
+                   actual - {basis} AS var_{basis},
+                   ROUND((actual - {basis}) / ABS({basis}) * 100, 1) AS var_{basis}_pct
+            FROM {_facts(as_of)} f
+            WHERE month_tag = ?
+        ),
+        r AS (
+            SELECT * FROM v
+            WHERE ABS(var_{basis}_pct) > ?
+            ORDER BY var_{basis}
+            LIMIT ?
+        )
+        SELECT {names}, r.actual, r.{basis}, r.var_{basis}, r.var_{basis}_pct
+        FROM r {joins}
+        ORDER BY r.var_{basis}
+    """, [month_tag, threshold_pct, limit])
+
+TREND_GROUPINGS = ('total', 'market', 'bucket', 'ledger')
+MOVING_AVERAGE_WINDOWS = (3, 6, 12)
+
+def _trend_source(by: str, metric: str, market: Optional[str], as_of=None) -> tuple:
+    """(SQL yielding month_tag, key, value, params) for one trend grouping, aggregated in DuckDB."""
+    market_params = [_market_id(market)] if market else []
+    market_filter = "AND market_id = ?" if market else ""
+    if by == 'bucket':
+        if not market:
+            return f"SELECT month_tag, bucket AS key, {metric} AS value FROM {_rollup('bucket', as_of)} r", []
+        return f"""
+            SELECT f.month_tag, lm.bucket AS key, SUM(f.{metric}) AS value
+            FROM {_facts(as_of)} f
+            JOIN dim_ledger dl ON dl.ledger_id = f.ledger_id
+            JOIN ledger_mapping lm ON lm.ledger = dl.ledger
+            WHERE f.market_id = ? AND lm.bucket IS NOT NULL
+            GROUP BY f.month_tag, lm.bucket
+        """, market_params
+    if by == 'ledger' and market:
+        return f"""
+            SELECT month_tag, ledger_id AS key, SUM({metric}) AS value
+            FROM {_facts(as_of)} f
+            WHERE market_id = ?
+            GROUP BY month_tag, ledger_id
+        """, market_params
+    if by == 'total' and not market:
+        return f"SELECT month_tag, 0 AS key, {metric} AS value FROM {_rollup('month', as_of)} r", []
+    if by == 'total':
+        return f"""
+            SELECT month_tag, 0 AS key, SUM({metric}) AS value
+            FROM {_rollup('market', as_of)} r
+            WHERE market_id = ?
+            GROUP BY month_tag
+        """, market_params
+    return f"""
+        SELECT month_tag, {by}_id AS key, {metric} AS value
+        FROM {_rollup(by, as_of)} r
+        WHERE TRUE {market_filter}
+    """, market_params
+
+@tracing.traced("database")
+def trend_metrics(by: str = 'total', metric: str = 'actual', market: Optional[str] = None,
+                  groups: Optional[tuple] = None, as_of=None) -> pd.DataFrame:
+    """Monthly ``metric`` per ``by`` group with its trend measures, computed in one windowed query.
+
+    Months are numbered (year * 12 + month) and every window is a RANGE
+    over that number, so a missing month leaves a gap instead of shifting
+    the comparison; tags that are not YYYY-MM are left out. Columns: month_tag, the group (except for 'total'),
+    value, ma_3 / ma_6 / ma_12 (NULL until the window holds that many
+    months), mom_pct, yoy_pct, ytd (calendar year to date) and run_rate
+    (ytd annualized over the months loaded so far this year). ``groups``
+    limits the result to those group names and cannot be combined with
+    'total'; the source is the rollups unless a ``market`` filter needs
+    line-level facts.
+    """
+    by = _check_choice(by, TREND_GROUPINGS, "by")
+    metric = _check_choice(metric, METRICS, "metric")
+    if groups and by == 'total':
+        raise ValueError("groups cannot be combined with by='total', which has no groups")
+    source, params = _trend_source(by, metric, market, as_of)
+    group_filter = ""
+    if groups:
+        placeholders = ", ".join("?" * len(groups))
+        group_filter = (f"WHERE key IN ({placeholders})" if by == 'bucket'
+                        else f"WHERE key IN (SELECT {by}_id FROM dim_{by} WHERE {by} IN ({placeholders}))")
+        params = params + list(groups)
+    averages = ",\n".join(
+        f"CASE WHEN COUNT(value) OVER (w RANGE BETWEEN {n - 1} PRECEDING AND CURRENT ROW) = {n} "
+        f"THEN AVG(value) OVER (w RANGE BETWEEN {n - 1} PRECEDING AND CURRENT ROW) END AS ma_{n}"
+        for n in MOVING_AVERAGE_WINDOWS
+    )
+    if by == 'total':
+        name, join, order = "", "", "t.month_tag"
+    elif by == 'bucket':
+        name, join, order = "t.key AS bucket, ", "", "bucket, t.month_tag"
+    else:
+        name, join, order = f"d.{by}, ", f"JOIN dim_{by} d ON d.{by}_id = t.key", f"d.{by}, t.month_tag"
+    return _fetchdf(f"""
+        WITH base AS (
+            SELECT month_tag, key, value,
+                   TRY_CAST(left(month_tag, 4) AS INTEGER) * 12 + TRY_CAST(right(month_tag, 2) AS INTEGER) - 1 AS month_index
+            FROM ({source}) s
+            {group_filter}
+        ),
+        t AS (
+            SELECT month_tag, key, month_index, value,
+                   {averages},
+                   MAX(value) OVER (w RANGE BETWEEN 1 PRECEDING AND 1 PRECEDING) AS previous_month,
+                   MAX(value) OVER (w RANGE BETWEEN 12 PRECEDING AND 12 PRECEDING) AS previous_year,
+                   SUM(value) OVER ytd AS ytd,
+                   COUNT(value) OVER ytd AS ytd_months
+            FROM base
+            WHERE month_index IS NOT NULL
+            WINDOW w AS (PARTITION BY key ORDER BY month_index),
+                   ytd AS (PARTITION BY key, month_index // 12 ORDER BY month_index ROWS UNBOUNDED PRECEDING)
+        )
+        SELECT t.month_tag, {name}t.value, {", ".join(f"t.ma_{n}" for n in MOVING_AVERAGE_WINDOWS)},
+               ROUND((t.value - t.previous_month) / ABS(t.previous_month) * 100, 1) AS mom_pct,
+               ROUND((t.value - t.previous_year) / ABS(t.previous_year) * 100, 1) AS yoy_pct,
+               t.ytd,
+               t.ytd / t.ytd_months * 12 AS run_rate
+        FROM t {join}
+        ORDER BY {order}
+    """, params)
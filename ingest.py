@@ -0,0 +1,150 @@
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pandas as pd
+
+import database as db
+
+DEFAULT_CHUNK_SIZE = 50_000
+CHUNK_FILE_PATTERN = "chunk-*.pkl"
+SUPPORTED_SUFFIXES = ('.xlsx',) + tuple(db.NATIVE_READERS)
+MAPPED_FIELDS = ('market_col', 'ledger_col', 'actual_col', 'plan_col', 'forecast_col')
+
+def _open_sheet(source):
+    from openpyxl import load_workbook
+    
+    if hasattr(source, "seek"):
+        source.seek(0)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    return workbook, workbook.worksheets[0]
+
+def _header(rows) -> list:
+    header = next(rows, None)
+    if header is None:
+        return []
+    return [str(c) if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+
+def excel_row_count(source) -> Optional[int]:
+    workbook, sheet = _open_sheet(source)
+    try:
+        return max(sheet.max_row - 1, 0) if sheet.max_row else None
+    finally:
+        workbook.close()
+
+def preview_excel(source, n_rows: int = 10) -> pd.DataFrame:
+    """Return the first ``n_rows`` data rows without parsing the rest of the sheet."""
+    workbook, sheet = _open_sheet(source)
+    try:
+        rows = sheet.iter_rows(values_only=True)
+        columns = _header(rows)
+        data = []
+        for row in rows:
+            if len(data) >= n_rows:
+                break
+            data.append(row[:len(columns)])
+        return pd.DataFrame(data, columns=columns)
+    finally:
+        workbook.close()
+
+def iter_excel_chunks(source, mapping: dict, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Stream the mapped columns of the first sheet as DataFrames of at most ``chunk_size`` rows."""
+    workbook, sheet = _open_sheet(source)
+    try:
+        rows = sheet.iter_rows(values_only=True)
+        columns = _header(rows)
+        wanted = list(dict.fromkeys(mapping[field] for field in MAPPED_FIELDS))
+        missing = [c for c in wanted if c not in columns]
+        if missing:
+            raise ValueError(f"Mapped columns not found in workbook: {', '.join(missing)}")
+        positions = [columns.index(c) for c in wanted]
+        buffer = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            buffer.append([row[p] if p < len(row) else None for p in positions])
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=wanted)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=wanted)
+    finally:
+        workbook.close()
+
+MONTH_TAG_PATTERN = re.compile(r"(\d{4}-(?:0[1-9]|1[0-2]))")
+
+def infer_month_tag(filename: str) -> Optional[str]:
+    match = MONTH_TAG_PATTERN.search(Path(filename).stem)
+    return match.group(1) if match else None
+
+def read_excel_mapped(source, mapping: dict, chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    chunks = list(iter_excel_chunks(source, mapping, chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=list(dict.fromkeys(mapping[field] for field in MAPPED_FIELDS)))
+    return pd.concat(chunks, ignore_index=True)
+
+def spill_excel_chunks(source, mapping: dict, directory, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Parse the workbook into numbered chunk files in ``directory`` and return the row count.
+
+    Meant for a worker process: only one chunk is held at a time, and the
+    caller can count the finished files to follow progress.
+    """
+    rows = 0
+    for i, chunk in enumerate(iter_excel_chunks(source, mapping, chunk_size)):
+        target = Path(directory) / f"chunk-{i:06d}.pkl"
+        staging = target.with_suffix(".tmp")
+        chunk.to_pickle(staging)
+        os.replace(staging, target)
+        rows += len(chunk)
+    return rows
+
+def iter_chunk_files(directory) -> Iterator[pd.DataFrame]:
+    """Load spilled chunks back in file order, deleting each one once it is read."""
+    for path in sorted(Path(directory).glob(CHUNK_FILE_PATTERN)):
+        frame = pd.read_pickle(path)
+        path.unlink()
+        yield frame
+
+def is_native_format(filename: str) -> bool:
+    return Path(filename).suffix.lower() in db.NATIVE_READERS
+
+def spool_upload(uploaded_file) -> Path:
+    """Write an in-memory upload to a temporary file so DuckDB's file readers can scan it; the caller deletes it."""
+    handle, path = tempfile.mkstemp(suffix=Path(uploaded_file.name).suffix.lower())
+    try:
+        with os.fdopen(handle, "wb") as out:
+            out.write(uploaded_file.getbuffer())
+    except BaseException:
+        os.unlink(path)
+        raise
+    return Path(path)
+
+@contextmanager
+def spooled_upload(uploaded_file):
+    """spool_upload() for the duration of a with block."""
+    path = spool_upload(uploaded_file)
+    try:
+        yield path
+    finally:
+        path.unlink(missing_ok=True)
+
+def detach_upload(path) -> Path:
+    """Copy a spooled upload to a temporary file that outlives the rerun; whoever consumes it deletes it."""
+    handle, target = tempfile.mkstemp(suffix=Path(path).suffix.lower())
+    os.close(handle)
+    shutil.copyfile(path, target)
+    return Path(target)
+
+def preview_file(path, n_rows: int = 10) -> pd.DataFrame:
+    if is_native_format(path):
+        return db.preview_native_file(path, n_rows)
+    return preview_excel(path, n_rows)
+
+def row_count(path) -> Optional[int]:
+    if is_native_format(path):
+        return db.native_row_count(path)
+    return excel_row_count(path)
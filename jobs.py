@@ -0,0 +1,204 @@
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+THREAD_WORKERS = 4
+PROCESS_WORKERS = min(4, os.cpu_count() or 1)
+MAX_FINISHED = 50
+POLL_SECONDS = 0.2
+
+class JobCancelled(Exception):
+    """Raised inside a job, from its progress callback or run_in_process, once cancel() was requested."""
+
+class Job:
+    """A background call plus the progress it reports; read by the UI on every rerun."""
+
+    def __init__(self, job_id: int, label: str, kind: str = "thread"):
+        self.id = job_id
+        self.label = label
+        self.kind = kind
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.committing = False
+        self._future = None
+        self._state = threading.Lock()
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def error_message(self) -> str:
+        return (self.error or "").splitlines()[0] if self.error else ""
+
+    def report(self, fraction: float, message: str = ""):
+        """Progress callback handed to thread jobs; raises JobCancelled once cancellation is requested."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        self.progress = min(max(fraction, 0.0), 1.0)
+        self.message = message
+
+    def cancel(self) -> bool:
+        """Cancel a queued job outright, or ask a running one to stop at its next progress report.
+
+        Refused (returns False) while the job is inside ``committing()``.
+        """
+        with self._state:
+            if self.done or self.committing:
+                return False
+            self._cancel.set()
+        if self._future is not None and self._future.cancel():
+            self._finish("cancelled")
+        return True
+
+    def wait(self, timeout: Optional[float] = None):
+        """Block until the job finishes and return its result; raises if it failed, was cancelled or timed out."""
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"Job {self.id} still {self.status} after {timeout}s")
+        if self.status == "failed":
+            raise RuntimeError(f"Job {self.id} ({self.label}) failed: {self.error_message}")
+        if self.status == "cancelled":
+            raise JobCancelled(self.id)
+        return self.result
+
+    def _finish(self, status: str):
+        self.status = status
+        self.finished = time.time()
+        self._finished.set()
+
+    def _run(self, func: Callable, args: tuple, kwargs: dict):
+        if self._cancel.is_set():
+            self._finish("cancelled")
+            return
+        self.status = "running"
+        self.started = time.time()
+        _current.job = self
+        try:
+            self.result = func(*args, progress=self.report, **kwargs)
+            self.progress = 1.0
+            self._finish("done")
+        except JobCancelled:
+            self._finish("cancelled")
+        except Exception as e:
+            self.error = f"{e}\n{traceback.format_exc()}"
+            self._finish("failed")
+        finally:
+            _current.job = None
+
+_thread_pool = ThreadPoolExecutor(max_workers=THREAD_WORKERS, thread_name_prefix="job")
+_process_pool = None
+_jobs = {}
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_current = threading.local()
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    # Spawned, not forked: the parent holds DuckDB handles, a kaleido pipe and server threads.
+    global _process_pool
+    with _lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=PROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+@contextmanager
+def committing():
+    """Mark the calling job's point of no return, e.g. a publish transaction.
+
+    Raises JobCancelled if a cancel is already pending; otherwise cancel()
+    is refused until the block exits, so a job that got this far finishes
+    as done with its result. Does nothing outside a job.
+    """
+    job = getattr(_current, "job", None)
+    if job is None:
+        yield
+        return
+    with job._state:
+        if job._cancel.is_set():
+            raise JobCancelled(job.id)
+        job.committing = True
+    try:
+        yield
+    finally:
+        job.committing = False
+
+def run_in_process(func: Callable, *args, on_wait: Optional[Callable[[], None]] = None, **kwargs):
+    """Run a picklable ``func`` on the shared process pool and wait for its result.
+
+    Meant for CPU-bound steps (workbook parsing) inside a thread job. While
+    waiting it checks the calling job for cancellation and calls
+    ``on_wait()`` every poll, e.g. to report progress; a call already
+    running in a worker cannot be interrupted, so its result is discarded.
+    """
+    future = _get_process_pool().submit(func, *args, **kwargs)
+    job = getattr(_current, "job", None)
+    while True:
+        try:
+            return future.result(timeout=POLL_SECONDS)
+        except FutureTimeout:
+            if job is not None and job.cancel_requested:
+                future.cancel()
+                raise JobCancelled(job.id)
+            if on_wait is not None:
+                on_wait()
+
+def _in_process(func: Callable, *args, progress: Callable, **kwargs):
+    progress(0.0, "Running in worker process")
+    return run_in_process(func, *args, **kwargs)
+
+def submit(label: str, func: Callable, *args, kind: str = "thread", **kwargs) -> Job:
+    """Queue ``func(*args, **kwargs)`` and return its Job immediately.
+
+    ``kind="thread"`` jobs also receive ``progress=callback``, where
+    ``callback(fraction, message)`` updates the job and raises JobCancelled
+    after cancel(). ``kind="process"`` jobs run a picklable ``func`` on the
+    process pool instead and report no intermediate progress.
+    """
+    if kind not in ("thread", "process"):
+        raise ValueError(f"kind must be 'thread' or 'process', not {kind!r}")
+    if kind == "process":
+        args = (func,) + args
+        func = _in_process
+    with _lock:
+        job = Job(next(_ids), label, kind)
+        _jobs[job.id] = job
+        finished = [j.id for j in _jobs.values() if j.done]
+        for job_id in finished[:-MAX_FINISHED]:
+            del _jobs[job_id]
+    job._future = _thread_pool.submit(job._run, func, args, kwargs)
+    return job
+
+def get(job_id: Optional[int]) -> Optional[Job]:
+    with _lock:
+        return _jobs.get(job_id)
+
+def cancel(job_id: int) -> bool:
+    job = get(job_id)
+    return job.cancel() if job is not None else False
+
+def list_jobs() -> list:
+    with _lock:
+        return sorted(_jobs.values(), key=lambda job: job.id, reverse=True)
@@ -0,0 +1,141 @@
+import argparse
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Optional
+
+import charts
+import database as db
+import tracing
+
+PAGE_WIDTH = 1200
+PAGE_HEIGHT = 600
+DEFAULT_WORKERS = 4
+DEFAULT_THRESHOLD = 5.0
+
+# Builds a section's figure from its pack arguments, straight from the database.
+BUILDERS = {
+    "scoreboard": lambda month_tag: charts.create_market_scoreboard(db.month_summary(month_tag, by='market'), month_tag),
+    "variance": lambda month_tag: charts.create_variance_analysis(db.month_summary(month_tag, by='bucket'), month_tag, by='bucket'),
+    "mom": lambda current, previous, market: charts.create_mom_comparison(
+        db.mom_delta(current, previous, market, by='ledger'), current, previous, market),
+    "movers": lambda current, previous, top_n: charts.create_top_movers(
+        db.top_movers(current, previous, top_n), current, previous, top_n),
+    "pareto": lambda month_tag, metric_key: charts.create_pareto_chart(
+        db.variance_pareto(month_tag, 'plan' if metric_key == 'variance_plan' else 'forecast', top_n=20), month_tag, metric_key),
+    "totals": lambda: charts.create_totals_trend(db.totals_by_month()),
+    "trends": lambda market, metric: charts.create_trends_chart(db.metric_trend(market, metric), market, metric),
+    "action_plan": lambda month_tag, threshold, basis: charts.create_action_plan_figure(
+        charts.create_action_plan_table(db.variance_exceptions(month_tag, threshold, limit=20, basis=basis), basis=basis),
+        month_tag, basis)
+}
+
+def render_pdf(fig) -> bytes:
+    """One PDF page via plotly's shared kaleido scope, whose Chromium process starts once per process and is reused."""
+    return fig.to_image(format="pdf", width=PAGE_WIDTH, height=fig.layout.height or PAGE_HEIGHT)
+
+def pack_sections(month_tag: str, previous_month: Optional[str] = None, threshold: float = DEFAULT_THRESHOLD,
+                  basis: str = 'plan', top_n: int = 10) -> list:
+    """(title, builder name, arguments) for every page of the month-end pack, in page order."""
+    sections = [
+        ("Market Scoreboard", "scoreboard", (month_tag,)),
+        ("Variance Analysis", "variance", (month_tag,))
+    ]
+    if previous_month:
+        sections += [
+            ("Month-over-Month", "mom", (month_tag, previous_month, None)),
+            ("Top Movers", "movers", (month_tag, previous_month, top_n))
+        ]
+    sections += [
+        ("Pareto vs Plan", "pareto", (month_tag, 'variance_plan')),
+        ("Total Performance Trend", "totals", ()),
+        ("Actual Trend, All Markets", "trends", (None, 'actual')),
+        ("Action Plan", "action_plan", (month_tag, threshold, basis))
+    ]
+    return sections
+
+def _direct_renderers() -> dict:
+    return {name: (lambda *args, build=build: render_pdf(build(*args))) for name, build in BUILDERS.items()}
+
+def merge_pdfs(pages: list, title: str = "") -> bytes:
+    """Concatenate (outline title, PDF bytes) pages into one document with a bookmark per page."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for outline, data in pages:
+        writer.append(io.BytesIO(data), outline_item=outline)
+    if title:
+        writer.add_metadata({"/Title": title})
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+@tracing.traced("export")
+def build_month_end_pack(
+    month_tag: str,
+    previous_month: Optional[str] = None,
+    renderers: Optional[dict] = None,
+    progress: Optional[Callable] = None,
+    workers: int = DEFAULT_WORKERS,
+    **options
+) -> bytes:
+    """Render every pack section to PDF and merge them, in page order, into one file.
+
+    ``renderers`` maps builder names to ``callable(*args) -> PDF bytes``; the
+    app passes its cached figure exports, otherwise figures are built here.
+    Sections run on a thread pool, so queries and figure building overlap
+    with kaleido, which renders one page at a time. ``progress(fraction,
+    message)`` is called as each page finishes.
+    """
+    renderers = {**_direct_renderers(), **(renderers or {})}
+    sections = pack_sections(month_tag, previous_month, **options)
+    report = progress or (lambda fraction, message: None)
+    report(0.0, f"Rendering {len(sections)} pages")
+    rendered = [None] * len(sections)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pack") as pool:
+        futures = {pool.submit(renderers[name], *args): i for i, (_, name, args) in enumerate(sections)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            rendered[i] = future.result()
+            report(done / (len(sections) + 1), f"Rendered {sections[i][0]}")
+    report(len(sections) / (len(sections) + 1), "Assembling PDF")
+    pdf = merge_pdfs([(title, data) for (title, _, _), data in zip(sections, rendered)],
+                     f"Month-End Pack {month_tag}")
+    report(1.0, "Done")
+    return pdf
+
+def previous_month_of(month_tag: str) -> Optional[str]:
+    earlier = [m for m in db.get_available_months() if m < month_tag]
+    return earlier[0] if earlier else None
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render the month-end pack for one month as a single PDF.")
+    parser.add_argument("month", help="Month to report, YYYY-MM")
+    parser.add_argument("--previous", default=None, help="Comparison month (default: the latest earlier month)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Action-plan variance threshold in %%")
+    parser.add_argument("--basis", choices=['plan', 'forecast'], default='plan')
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--output", default=None, help="PDF path (default: month_end_pack_<month>.pdf)")
+    parser.add_argument("--db", default=str(db.DB_PATH), help="DuckDB file to read")
+    args = parser.parse_args(argv)
+
+    db.configure(args.db)
+    db.init_database()
+    if args.month not in db.get_available_months():
+        print(f"No data loaded for {args.month}.", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    pdf = build_month_end_pack(
+        args.month, args.previous or previous_month_of(args.month),
+        progress=lambda fraction, message: print(f"  {fraction:>4.0%} {message}"),
+        workers=args.workers, threshold=args.threshold, basis=args.basis
+    )
+    output = Path(args.output or f"month_end_pack_{args.month}.pdf")
+    output.write_bytes(pdf)
+    print(f"Wrote {output} ({len(pdf) / 1024:,.0f} KB) in {time.perf_counter() - started:.2f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,100 +1,215 @@
-import pandas as pd
-import numpy as np
+import argparse
+import time
 from pathlib import Path
+from typing import Optional, Sequence, Union
 
-def generate_sample_data():
-    np.random.seed(42)
-    
-    markets = ['North America', 'Europe', 'Asia Pacific', 'Latin America', 'Middle East']
-    ledgers = [
-        'Revenue - Product Sales',
-        'Revenue - Services',
-        'COGS - Materials',
-        'COGS - Labor',
-        'COGS - Overhead',
-        'SG&A - Marketing',
-        'SG&A - Sales',
-        'SG&A - Admin',
-        'R&D - Development',
-        'R&D - Research',
-        'Depreciation',
-        'Interest Expense',
-        'Other Income',
-        'Tax Expense'
-    ]
-    
-    months = ['2024-07', '2024-08', '2024-09', '2024-10', '2024-11', '2024-12']
-    
-    Path("sample_data").mkdir(exist_ok=True)
-    
-    base_values = {
-        'Revenue - Product Sales': 1000000,
-        'Revenue - Services': 300000,
-        'COGS - Materials': -400000,
-        'COGS - Labor': -200000,
-        'COGS - Overhead': -100000,
-        'SG&A - Marketing': -80000,
-        'SG&A - Sales': -120000,
-        'SG&A - Admin': -60000,
-        'R&D - Development': -50000,
-        'R&D - Research': -30000,
-        'Depreciation': -25000,
-        'Interest Expense': -15000,
-        'Other Income': 10000,
-        'Tax Expense': -50000
-    }
-    
-    market_multipliers = {
-        'North America': 1.5,
-        'Europe': 1.2,
-        'Asia Pacific': 1.0,
-        'Latin America': 0.6,
-        'Middle East': 0.4
-    }
-    
-    for i, month in enumerate(months):
-        data = []
-        growth_factor = 1 + (i * 0.02)
-        
-        for market in markets:
-            for ledger in ledgers:
-                base = base_values[ledger] * market_multipliers[market] * growth_factor
-                actual = base * (1 + np.random.uniform(-0.1, 0.15))
-                plan = base * (1 + np.random.uniform(-0.05, 0.05))
-                forecast = base * (1 + np.random.uniform(-0.08, 0.08))
-                
-                data.append({
-                    'Market': market,
-                    'Ledger Account': ledger,
-                    'Actual': round(actual, 2),
-                    'Plan': round(plan, 2),
-                    'Forecast': round(forecast, 2)
-                })
-        
-        df = pd.DataFrame(data)
-        filename = f"sample_data/financial_report_{month}.xlsx"
-        df.to_excel(filename, index=False)
-        print(f"Generated: {filename}")
-    
-    ledger_mapping = pd.DataFrame([
-        {'ledger': 'Revenue - Product Sales', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'Revenue - Services', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'COGS - Materials', 'bucket': 'COGS', 'driver': 'Volume', 'controllable': True},
-        {'ledger': 'COGS - Labor', 'bucket': 'COGS', 'driver': 'Headcount', 'controllable': True},
-        {'ledger': 'COGS - Overhead', 'bucket': 'COGS', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'SG&A - Marketing', 'bucket': 'SG&A', 'driver': 'Discretionary', 'controllable': True},
-        {'ledger': 'SG&A - Sales', 'bucket': 'SG&A', 'driver': 'Headcount', 'controllable': True},
-        {'ledger': 'SG&A - Admin', 'bucket': 'SG&A', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'R&D - Development', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
-        {'ledger': 'R&D - Research', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
-        {'ledger': 'Depreciation', 'bucket': 'Non-Cash', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'Interest Expense', 'bucket': 'Financing', 'driver': 'Fixed', 'controllable': False},
-        {'ledger': 'Other Income', 'bucket': 'Other', 'driver': 'Variable', 'controllable': False},
-        {'ledger': 'Tax Expense', 'bucket': 'Tax', 'driver': 'Calculated', 'controllable': False}
-    ])
-    ledger_mapping.to_excel("sample_data/ledger_mapping.xlsx", index=False)
-    print("Generated: sample_data/ledger_mapping.xlsx")
+import duckdb
+import numpy as np
+import pandas as pd
 
-if __name__ == "__main__":
-    generate_sample_data()
+BASE_VALUES = {
+    'Revenue - Product Sales': 1000000,
+    'Revenue - Services': 300000,
+    'COGS - Materials': -400000,
+    'COGS - Labor': -200000,
+    'COGS - Overhead': -100000,
+    'SG&A - Marketing': -80000,
+    'SG&A - Sales': -120000,
+    'SG&A - Admin': -60000,
+    'R&D - Development': -50000,
+    'R&D - Research': -30000,
+    'Depreciation': -25000,
+    'Interest Expense': -15000,
+    'Other Income': 10000,
+    'Tax Expense': -50000
+}
+
+MARKET_MULTIPLIERS = {
+    'North America': 1.5,
+    'Europe': 1.2,
+    'Asia Pacific': 1.0,
+    'Latin America': 0.6,
+    'Middle East': 0.4
+}
+
+LEDGER_MAPPING = pd.DataFrame([
+    {'ledger': 'Revenue - Product Sales', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
+    {'ledger': 'Revenue - Services', 'bucket': 'Revenue', 'driver': 'Volume', 'controllable': True},
+    {'ledger': 'COGS - Materials', 'bucket': 'COGS', 'driver': 'Volume', 'controllable': True},
+    {'ledger': 'COGS - Labor', 'bucket': 'COGS', 'driver': 'Headcount', 'controllable': True},
+    {'ledger': 'COGS - Overhead', 'bucket': 'COGS', 'driver': 'Fixed', 'controllable': False},
+    {'ledger': 'SG&A - Marketing', 'bucket': 'SG&A', 'driver': 'Discretionary', 'controllable': True},
+    {'ledger': 'SG&A - Sales', 'bucket': 'SG&A', 'driver': 'Headcount', 'controllable': True},
+    {'ledger': 'SG&A - Admin', 'bucket': 'SG&A', 'driver': 'Fixed', 'controllable': False},
+    {'ledger': 'R&D - Development', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
+    {'ledger': 'R&D - Research', 'bucket': 'R&D', 'driver': 'Project', 'controllable': True},
+    {'ledger': 'Depreciation', 'bucket': 'Non-Cash', 'driver': 'Fixed', 'controllable': False},
+    {'ledger': 'Interest Expense', 'bucket': 'Financing', 'driver': 'Fixed', 'controllable': False},
+    {'ledger': 'Other Income', 'bucket': 'Other', 'driver': 'Variable', 'controllable': False},
+    {'ledger': 'Tax Expense', 'bucket': 'Tax', 'driver': 'Calculated', 'controllable': False}
+])
+
+# Relative (low, high) noise applied to the base value of each measure.
+NOISE_PROFILES = {
+    'default': {'Actual': (-0.10, 0.15), 'Plan': (-0.05, 0.05), 'Forecast': (-0.08, 0.08)},
+    'calm': {'Actual': (-0.02, 0.03), 'Plan': (-0.01, 0.01), 'Forecast': (-0.02, 0.02)},
+    'volatile': {'Actual': (-0.40, 0.50), 'Plan': (-0.10, 0.10), 'Forecast': (-0.25, 0.25)}
+}
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet', 'duckdb')
+COLUMN_MAPPING = ('Market', 'Ledger Account', 'Actual', 'Plan', 'Forecast')
+
+def month_range(start_month: str, count: int) -> list:
+    return [p.strftime('%Y-%m') for p in pd.period_range(start=start_month, periods=count, freq='M')]
+
+def _market_dimension(markets: Union[int, Sequence[str]], rng: np.random.Generator) -> tuple:
+    names = list(MARKET_MULTIPLIERS)[:markets] if isinstance(markets, int) else list(markets)
+    if isinstance(markets, int) and markets > len(names):
+        names += [f"Market {i:04d}" for i in range(len(names) + 1, markets + 1)]
+    extra = rng.uniform(0.3, 1.5, len(names))
+    multipliers = np.array([MARKET_MULTIPLIERS.get(name, extra[i]) for i, name in enumerate(names)])
+    return names, multipliers
+
+def _ledger_dimension(ledgers: Union[int, Sequence[str]]) -> tuple:
+    """Return ledger names plus the template ledger each one inherits its base value and bucket from."""
+    templates = list(BASE_VALUES)
+    if isinstance(ledgers, int):
+        names = [templates[i] if i < len(templates) else f"{templates[i % len(templates)]} {i // len(templates):04d}"
+                 for i in range(ledgers)]
+        parents = [templates[i % len(templates)] for i in range(ledgers)]
+    else:
+        names = list(ledgers)
+        parents = [name if name in BASE_VALUES else templates[i % len(templates)] for i, name in enumerate(names)]
+    return names, parents
+
+def generate_frame(
+    markets: Union[int, Sequence[str]] = 5,
+    ledgers: Union[int, Sequence[str]] = 14,
+    months: Union[int, Sequence[str]] = 6,
+    seed: int = 42,
+    noise: str = 'default',
+    start_month: str = '2024-07'
+) -> pd.DataFrame:
+    """Build a month x market x ledger grid of Actual/Plan/Forecast values in one vectorized pass.
 
+    Rows are ordered month, market, ledger and the values depend only on the
+    arguments, so the same call always produces the same frame.
+    """
+    if noise not in NOISE_PROFILES:
+        raise ValueError(f"noise must be one of {', '.join(NOISE_PROFILES)}")
+    rng = np.random.default_rng(seed)
+    month_tags = month_range(start_month, months) if isinstance(months, int) else list(months)
+    market_names, multipliers = _market_dimension(markets, rng)
+    ledger_names, parents = _ledger_dimension(ledgers)
+    base_values = np.array([BASE_VALUES[p] for p in parents], dtype=np.float64)
+
+    n_months, n_markets, n_ledgers = len(month_tags), len(market_names), len(ledger_names)
+    growth = 1 + np.arange(n_months) * 0.02
+    base = (growth[:, None, None] * multipliers[None, :, None] * base_values[None, None, :]).ravel()
+    rows = base.size
+
+    frame = pd.DataFrame({
+        'month_tag': pd.Categorical.from_codes(np.repeat(np.arange(n_months, dtype=np.int32), n_markets * n_ledgers), month_tags),
+        'Market': pd.Categorical.from_codes(np.tile(np.repeat(np.arange(n_markets, dtype=np.int32), n_ledgers), n_months), market_names),
+        'Ledger Account': pd.Categorical.from_codes(np.tile(np.arange(n_ledgers, dtype=np.int32), n_months * n_markets), ledger_names)
+    })
+    for column, (low, high) in NOISE_PROFILES[noise].items():
+        frame[column] = np.round(base * (1 + rng.uniform(low, high, rows)), 2)
+    return frame
+
+def ledger_mapping_for(frame: pd.DataFrame) -> pd.DataFrame:
+    names = list(frame['Ledger Account'].cat.categories) if hasattr(frame['Ledger Account'], 'cat') else list(frame['Ledger Account'].unique())
+    _, parents = _ledger_dimension(names)
+    template = LEDGER_MAPPING.set_index('ledger')
+    mapping = template.loc[parents].reset_index(drop=True)
+    mapping.insert(0, 'ledger', names)
+    return mapping
+
+def _month_slices(frame: pd.DataFrame):
+    codes = frame['month_tag'].cat.codes.to_numpy()
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    starts = np.concatenate(([0], bounds))
+    ends = np.concatenate((bounds, [len(frame)]))
+    for start, end in zip(starts, ends):
+        if end > start:
+            yield frame['month_tag'].cat.categories[codes[start]], frame.iloc[start:end].drop(columns='month_tag')
+
+def write_files(frame: pd.DataFrame, output_dir: Union[str, Path] = "sample_data", fmt: str = 'xlsx') -> list:
+    """Write one ``financial_report_<YYYY-MM>.<fmt>`` per month plus ledger_mapping.xlsx."""
+    if fmt not in OUTPUT_FORMATS[:-1]:
+        raise ValueError(f"fmt must be one of {', '.join(OUTPUT_FORMATS[:-1])}")
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    con = duckdb.connect() if fmt != 'xlsx' else None
+    try:
+        for month, month_frame in _month_slices(frame):
+            path = output_dir / f"financial_report_{month}.{fmt}"
+            if fmt == 'xlsx':
+                month_frame.to_excel(path, index=False, engine='xlsxwriter')
+            else:
+                con.register('month_frame', month_frame)
+                options = "FORMAT PARQUET" if fmt == 'parquet' else "FORMAT CSV, HEADER"
+                con.execute(f"COPY month_frame TO '{path.as_posix()}' ({options})")
+                con.unregister('month_frame')
+            written.append(path)
+    finally:
+        if con is not None:
+            con.close()
+    ledger_mapping_for(frame).to_excel(output_dir / "ledger_mapping.xlsx", index=False)
+    written.append(output_dir / "ledger_mapping.xlsx")
+    return written
+
+def load_into_database(frame: pd.DataFrame) -> list:
+    """Save the column mapping, ledger mapping and every month of ``frame`` through the regular ingest path."""
+    import database as db
+
+    db.init_database()
+    db.save_column_mapping(*COLUMN_MAPPING)
+    db.save_ledger_mapping(ledger_mapping_for(frame))
+    mapping = db.get_column_mapping()
+    return [db.save_financial_snapshot(month_frame, month, mapping) for month, month_frame in _month_slices(frame)]
+
+def generate_sample_data(
+    markets: Union[int, Sequence[str]] = 5,
+    ledgers: Union[int, Sequence[str]] = 14,
+    months: Union[int, Sequence[str]] = 6,
+    seed: int = 42,
+    noise: str = 'default',
+    fmt: str = 'xlsx',
+    output_dir: Union[str, Path] = "sample_data",
+    db_path: Optional[str] = None,
+    start_month: str = '2024-07'
+):
+    frame = generate_frame(markets, ledgers, months, seed, noise, start_month)
+    if fmt == 'duckdb':
+        if db_path:
+            import database as db
+            db.configure(db_path)
+        for report in load_into_database(frame):
+            print(f"Loaded: {report['month_tag']} ({report['rows_written']:,} rows)")
+        return
+    for path in write_files(frame, output_dir, fmt):
+        print(f"Generated: {path.as_posix()}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic financial reports.")
+    parser.add_argument("--markets", type=int, default=5)
+    parser.add_argument("--ledgers", type=int, default=14)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--start-month", default='2024-07')
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--noise", choices=list(NOISE_PROFILES), default='default')
+    parser.add_argument("--format", dest="fmt", choices=OUTPUT_FORMATS, default='xlsx')
+    parser.add_argument("--output", default="sample_data", help="Directory for generated report files")
+    parser.add_argument("--db", default=None, help="DuckDB file to load when --format duckdb")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    generate_sample_data(args.markets, args.ledgers, args.months, args.seed, args.noise,
+                         args.fmt, args.output, args.db, args.start_month)
+    rows = args.markets * args.ledgers * args.months
+    print(f"{rows:,} rows in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import multiprocessing
+import statistics
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import database as db
+import sample_data_generator as generator
+
+DEFAULT_READERS = 4
+DEFAULT_WRITERS = 2
+DEFAULT_SECONDS = 20.0
+DEFAULT_MAX_LATENCY = 1.0
+WRITER_PAUSE = 0.25
+
+def _reader_queries(months: list) -> dict:
+    current, previous = months[0], months[1]
+    return {
+        "get_available_months": lambda: db.get_available_months(),
+        "month_summary": lambda: db.month_summary(current, 'market'),
+        "mom_delta": lambda: db.mom_delta(current, previous),
+        "top_movers": lambda: db.top_movers(current, previous, 10),
+        "variance_pareto": lambda: db.variance_pareto(current, 'plan'),
+        "totals_by_month": lambda: db.totals_by_month(),
+        "data_versions": lambda: db.get_data_versions()
+    }
+
+def run_reader(path: str, mode: str, seconds: float, start_at: float) -> dict:
+    """Cycle through the dashboard queries until the deadline, timing each one and counting failures."""
+    db.configure(path, mode)
+    latencies, errors, versions = [], [], set()
+    queries = None
+    while time.time() < start_at:
+        time.sleep(0.01)
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            if queries is None:
+                queries = _reader_queries(db.get_available_months())
+            for name, query in queries.items():
+                started = time.perf_counter()
+                result = query()
+                latencies.append(time.perf_counter() - started)
+                if name == "data_versions":
+                    versions.add(result.get("snapshots", 0))
+        except Exception as e:
+            errors.append(f"{type(e).__name__}: {str(e).splitlines()[0]}")
+            time.sleep(0.05)
+    db.close_connections()
+    return {"latencies": latencies, "errors": errors, "versions_seen": len(versions)}
+
+def run_writer(path: str, mode: str, seconds: float, start_at: float, seed: int, markets: int, ledgers: int, months: int) -> dict:
+    """Re-ingest freshly generated months until the deadline, timing each save including lock waits."""
+    db.configure(path, mode)
+    frame = generator.generate_frame(markets, ledgers, months, seed=seed)
+    mapping = None
+    slices = list(generator._month_slices(frame))
+    durations, errors = [], []
+    while time.time() < start_at:
+        time.sleep(0.01)
+    deadline = time.time() + seconds
+    i = 0
+    while time.time() < deadline:
+        month_tag, month_frame = slices[i % len(slices)]
+        month_frame = month_frame.assign(Actual=month_frame['Actual'] * (1 + 0.001 * (i + 1)))
+        started = time.perf_counter()
+        try:
+            mapping = mapping or db.get_column_mapping()
+            db.save_financial_snapshot(month_frame, month_tag, mapping)
+            durations.append(time.perf_counter() - started)
+        except Exception:
+            errors.append(traceback.format_exc().strip().splitlines()[-1])
+        i += 1
+        # Back-to-back saves from one process would re-take the lock before the other writers wake up.
+        time.sleep(WRITER_PAUSE)
+    db.close_connections()
+    return {"durations": durations, "errors": errors}
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+def run(readers: int = DEFAULT_READERS, writers: int = DEFAULT_WRITERS, seconds: float = DEFAULT_SECONDS,
+        mode: str = 'shared', markets: int = 20, ledgers: int = 2000, months: int = 6) -> dict:
+    """Seed a database, then run reader and writer processes against it concurrently and collect their stats."""
+    with tempfile.TemporaryDirectory(prefix="fa-stress-") as tmp:
+        path = str(Path(tmp) / "stress.duckdb")
+        db.configure(path, mode)
+        generator.load_into_database(generator.generate_frame(markets, ledgers, months))
+        db.close_connections()
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=readers + writers, mp_context=context) as pool:
+            # Leave time for every worker to spawn and import before the clock starts.
+            start_at = time.time() + 3.0
+            reader_futures = [pool.submit(run_reader, path, mode, seconds, start_at) for _ in range(readers)]
+            writer_futures = [pool.submit(run_writer, path, mode, seconds, start_at, seed, markets, ledgers, months)
+                              for seed in range(writers)]
+            reader_results = [f.result() for f in reader_futures]
+            writer_results = [f.result() for f in writer_futures]
+    return {"mode": mode, "seconds": seconds, "rows": markets * ledgers * months,
+            "readers": reader_results, "writers": writer_results}
+
+def summarize(results: dict, max_latency: float = DEFAULT_MAX_LATENCY) -> bool:
+    print(f"{'Process':<10} {'Ops':>7} {'Errors':>7} {'p50 ms':>9} {'p99 ms':>9} {'Max ms':>9} {'Versions':>9}")
+    passed = True
+    for i, r in enumerate(results["readers"]):
+        lat = r["latencies"]
+        print(f"reader {i:<3} {len(lat):>7} {len(r['errors']):>7} {statistics.median(lat) * 1000 if lat else 0:>9.1f} "
+              f"{_percentile(lat, 0.99) * 1000:>9.1f} {max(lat, default=0) * 1000:>9.1f} {r['versions_seen']:>9}")
+        passed &= not r["errors"] and max(lat, default=0) <= max_latency and r["versions_seen"] > 1
+    for i, w in enumerate(results["writers"]):
+        dur = w["durations"]
+        print(f"writer {i:<3} {len(dur):>7} {len(w['errors']):>7} {statistics.median(dur) * 1000 if dur else 0:>9.1f} "
+              f"{_percentile(dur, 0.99) * 1000:>9.1f} {max(dur, default=0) * 1000:>9.1f} {'':>9}")
+        passed &= not w["errors"] and bool(dur)
+    errors = [e for r in results["readers"] + results["writers"] for e in r["errors"]]
+    for message in sorted(set(errors))[:5]:
+        print(f"  error: {message}")
+    print(f"\n{results['mode']} mode, {results['rows']:,} rows, {results['seconds']:.0f}s: "
+          + ("PASS" if passed else "FAIL")
+          + f" (readers must see no errors, stay under {max_latency * 1000:.0f} ms per query and observe new data)")
+    return passed
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run concurrent reader and writer processes against one database file.")
+    parser.add_argument("--readers", type=int, default=DEFAULT_READERS)
+    parser.add_argument("--writers", type=int, default=DEFAULT_WRITERS)
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS)
+    parser.add_argument("--mode", choices=db.DB_MODES, default='shared', help="'single' shows the lock conflicts shared mode avoids")
+    parser.add_argument("--markets", type=int, default=20)
+    parser.add_argument("--ledgers", type=int, default=2000)
+    parser.add_argument("--months", type=int, default=6)
+    parser.add_argument("--max-latency", type=float, default=DEFAULT_MAX_LATENCY, help="Slowest acceptable reader query, seconds")
+    args = parser.parse_args(argv)
+
+    results = run(args.readers, args.writers, args.seconds, args.mode, args.markets, args.ledgers, args.months)
+    return 0 if summarize(results, args.max_latency) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
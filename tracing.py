@@ -0,0 +1,138 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+class Trace:
+    """Spans recorded during one unit of work, typically a single Streamlit rerun."""
+
+    def __init__(self, label: str = "rerun"):
+        self.label = label
+        self.started_ns = time.perf_counter_ns()
+        self.wall_started = time.time()
+        self.finished_ns = None
+        self.spans = []
+        self._depth = 0
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.finished_ns or time.perf_counter_ns()
+        return (end - self.started_ns) / 1e6
+
+    def summary(self) -> pd.DataFrame:
+        """Aggregate spans by name: call count, total and max time, rows returned."""
+        if not self.spans:
+            return pd.DataFrame(columns=['category', 'name', 'calls', 'total_ms', 'max_ms', 'rows'])
+        frame = pd.DataFrame(self.spans)
+        if 'rows' not in frame.columns:
+            frame['rows'] = None
+        summary = frame.groupby(['category', 'name'], sort=False).agg(
+            calls=('duration_ms', 'size'),
+            total_ms=('duration_ms', 'sum'),
+            max_ms=('duration_ms', 'max'),
+            rows=('rows', lambda rows: rows.sum(min_count=1))
+        ).reset_index()
+        summary['rows'] = summary['rows'].astype('Int64')
+        return summary.sort_values('total_ms', ascending=False, ignore_index=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "started": self.wall_started,
+            "duration_ms": self.duration_ms,
+            "spans": self.spans
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2, default=str)
+
+    def to_chrome_trace(self) -> str:
+        """Serialize as Chrome trace-event JSON, loadable in chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        events = [{
+            "name": self.label,
+            "cat": "rerun",
+            "ph": "X",
+            "ts": 0,
+            "dur": self.duration_ms * 1000,
+            "pid": pid,
+            "tid": 0
+        }]
+        for span in self.spans:
+            args = dict(span["args"])
+            if span.get("rows") is not None:
+                args["rows"] = span["rows"]
+            events.append({
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": span["start_ms"] * 1000,
+                "dur": span["duration_ms"] * 1000,
+                "pid": pid,
+                "tid": span["thread"],
+                "args": args
+            })
+        return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, default=str)
+
+_active: ContextVar[Optional[Trace]] = ContextVar("active_trace", default=None)
+
+def current_trace() -> Optional[Trace]:
+    return _active.get()
+
+@contextmanager
+def record(label: str = "rerun"):
+    """Collect every span opened in this context into a new Trace."""
+    trace = Trace(label)
+    token = _active.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished_ns = time.perf_counter_ns()
+        _active.reset(token)
+
+def row_count(value: Any) -> Optional[int]:
+    if isinstance(value, (pd.DataFrame, pd.Series, list, tuple)):
+        return len(value)
+    return None
+
+@contextmanager
+def span(name: str, category: str = "app", **args):
+    """Time a block. Yields a dict whose ``rows`` and ``args`` may be filled in by the caller."""
+    trace = _active.get()
+    if trace is None:
+        yield {"args": args}
+        return
+    entry = {"name": name, "category": category, "args": args, "rows": None, "depth": trace._depth,
+             "thread": threading.get_ident()}
+    trace._depth += 1
+    started = time.perf_counter_ns()
+    try:
+        yield entry
+    finally:
+        ended = time.perf_counter_ns()
+        trace._depth -= 1
+        entry["start_ms"] = (started - trace.started_ns) / 1e6
+        entry["duration_ms"] = (ended - started) / 1e6
+        trace.spans.append(entry)
+
+def traced(category: str, name: Optional[str] = None) -> Callable:
+    """Decorator form of span(); records the row count of DataFrame / list results."""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name, category) as entry:
+                result = func(*args, **kwargs)
+                entry["rows"] = row_count(result)
+                return result
+        return wrapper
+    return decorator